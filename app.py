@@ -1,34 +1,45 @@
 from flask import Flask, Response, request, jsonify
 import threading
 import socket
-import cv2
 import time
-from src.shared_state import camera_streams, stop_event, get_frame, sensor_data, update_sensor_data
-from datetime import datetime
+from src.shared_state import camera_streams, stop_event, get_stream_jpeg, get_frame_seq, wait_for_frame, get_frame_stats, sensor_data, update_sensor_data, device_health, acquire_viewer, release_viewer
+from src.frame_scheduler import scheduler
+from src.stream_profiles import FULL_PROFILE, parse_profile, parse_snapshot_profile, frame_interval
+from datetime import datetime, timezone
 import os
 from flask_cors import CORS
 
 OPERATION_MODE = os.getenv("OPERATION_MODE", 'simulation')
+# "dev" runs the Werkzeug development server with a thread per viewer; "asgi" serves
+# through uvicorn, streaming /video_feed from async generators
+SERVER_MODE = os.getenv("SERVER_MODE", 'asgi' if OPERATION_MODE == 'production' else 'dev')
+
+# Part of every snapshot ETag, since frame sequence numbers restart with the process
+SNAPSHOT_ETAG_PREFIX = f"{os.getpid():x}{int(time.time()):x}"
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-def generate_frames(camera_id):
+def generate_frames(camera_id, profile=FULL_PROFILE):
+    last_seq = 0
+    interval = frame_interval(profile)
     while not stop_event.is_set():
         try:
-            frame = get_frame(camera_id)
-            if frame is None:
-                time.sleep(0.01)  # Wait briefly if no frame is available
+            # Sleep until the camera publishes a newer frame (or a second passes,
+            # to notice shutdown)
+            if not wait_for_frame(camera_id, last_seq):
                 continue
-                
-            ret, buffer = cv2.imencode('.jpg', frame)
-            if not ret:
-                print(f"Failed to encode frame from camera {camera_id}")
+            # Frames are encoded once per camera and profile, and shared by all viewers
+            encoded = get_stream_jpeg(camera_id, profile)
+            if encoded is None or encoded.seq == last_seq:
                 continue
-                
-            frame = buffer.tobytes()
+
+            last_seq = encoded.seq
             yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                   b'Content-Type: image/jpeg\r\n\r\n' + encoded.data + b'\r\n')
+            if interval:
+                # Hold the stream to the viewer's frame rate cap
+                stop_event.wait(interval)
         except Exception as e:
             print(f"Error generating frame for camera {camera_id}: {str(e)}")
             time.sleep(0.1)  # Wait a bit longer on error
@@ -43,9 +54,16 @@ def get_mode():
 def video_feed(camera_id):
     camera = camera_streams.get(camera_id)
     if camera:
+        try:
+            profile = parse_profile(request.args)
+        except ValueError as e:
+            return str(e), 400
+        if not acquire_viewer(camera_id):
+            return f"Too many viewers for camera {camera_id}", 503, {'Retry-After': '5'}
         print(f"Serving video feed for camera {camera_id}: {camera.get('name', 'Unknown')}")
-        response = Response(generate_frames(camera_id),
+        response = Response(generate_frames(camera_id, profile),
                           mimetype='multipart/x-mixed-replace; boundary=frame')
+        response.call_on_close(lambda: release_viewer(camera_id))
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Cache-Control', 'no-cache, no-store, must-revalidate')
         response.headers.add('Pragma', 'no-cache')
@@ -53,13 +71,46 @@ def video_feed(camera_id):
         return response
     return f"Camera {camera_id} not found", 404
 
+def snapshot_etag(camera_id, seq, profile):
+    return f"{SNAPSHOT_ETAG_PREFIX}-{camera_id}-{seq}-{profile.scale}-{profile.quality}"
+
+@app.route('/snapshot/<int:camera_id>')
+def snapshot(camera_id):
+    """Latest frame of a camera as a single JPEG, with ETag-based conditional requests"""
+    if camera_id not in camera_streams:
+        return f"Camera {camera_id} not found", 404
+    try:
+        profile = parse_snapshot_profile(request.args)
+    except ValueError as e:
+        return str(e), 400
+
+    # Answer pollers whose copy is current before encoding anything
+    seq = get_frame_seq(camera_id)
+    etag = snapshot_etag(camera_id, seq, profile)
+    if seq and request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+    # Shared with every viewer and poller asking for the same size
+    encoded = get_stream_jpeg(camera_id, profile)
+    if encoded is None:
+        return f"No frame from camera {camera_id} yet", 503, {'Retry-After': '1'}
+    response = Response(encoded.data, mimetype='image/jpeg')
+    response.set_etag(snapshot_etag(camera_id, encoded.seq, profile))
+    response.last_modified = datetime.fromtimestamp(encoded.timestamp, timezone.utc)
+    # Clients may cache the image but must revalidate it on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/sensor_data', methods=['POST'])
-def sensor_data():
+def post_sensor_data():
     try:
         data = request.get_json()
         value = data.get('value')
         if value is not None:
-            update_sensor_data(int(value))
+            if data.get('mac'):
+                update_sensor_data(int(value), data['mac'].lower())
+            else:
+                update_sensor_data(int(value))
             return jsonify({"status": "success"}), 200
         return jsonify({"status": "error", "message": "No value provided"}), 400
     except Exception as e:
@@ -70,6 +121,21 @@ def get_sensor_status():
     """Endpoint to check sensor status"""
     return jsonify(sensor_data)
 
+@app.route('/device_health')
+def get_device_health():
+    """Endpoint to check reachability of sensors and cameras"""
+    return jsonify(device_health)
+
+@app.route('/frame_stats')
+def frame_stats():
+    """Endpoint to check frame buffer counters per camera"""
+    return jsonify(get_frame_stats())
+
+@app.route('/cadence')
+def cadence():
+    """Endpoint to check the detection cadence chosen for each camera and why"""
+    return jsonify(scheduler.stats())
+
 # Find a free port for the Flask server
 def find_free_port():
     # Use just port 2003 since this server is now identified by MAC address
@@ -84,8 +150,14 @@ def find_free_port():
 
 def start_flask_app():
     port = 2003  # Use fixed port 2003 to match discovery service
-    print(f"Starting Flask server on port {port}")
-    app.run(host='0.0.0.0', port=port, threaded=True)
+    if SERVER_MODE == 'asgi':
+        import uvicorn
+        from src.asgi_server import create_asgi_app
+        print(f"Starting ASGI server on port {port}")
+        uvicorn.run(create_asgi_app(app), host='0.0.0.0', port=port, log_level='warning')
+    else:
+        print(f"Starting Flask server on port {port}")
+        app.run(host='0.0.0.0', port=port, threaded=True)
 
 if __name__ == '__main__':
     # Start Flask app in a separate thread
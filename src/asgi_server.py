@@ -0,0 +1,119 @@
+import re
+import asyncio
+import logging
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from src.shared_state import (camera_streams, stop_event, get_stream_jpeg, wait_for_frame_async,
+                              acquire_viewer, release_viewer)
+from src.stream_profiles import StreamProfile, parse_profile, frame_interval
+
+logger = logging.getLogger(__name__)
+
+VIDEO_FEED_PATH = re.compile(r'/video_feed/(\d+)')
+
+# Seconds a viewer waits for a frame before re-checking for shutdown and disconnects
+FRAME_WAIT_TIMEOUT = 1.0
+
+MJPEG_HEADERS = [
+    (b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+    (b'access-control-allow-origin', b'*'),
+    (b'cache-control', b'no-cache, no-store, must-revalidate'),
+    (b'pragma', b'no-cache'),
+    (b'expires', b'0'),
+]
+
+async def mjpeg_frames(camera_id: int, profile: StreamProfile, disconnected: asyncio.Event):
+    """Yield multipart MJPEG parts as soon as the camera publishes new frames"""
+    loop = asyncio.get_running_loop()
+    interval = frame_interval(profile)
+    last_seq = 0
+    while not stop_event.is_set() and not disconnected.is_set():
+        if not await wait_for_frame_async(camera_id, last_seq, FRAME_WAIT_TIMEOUT):
+            continue
+        # Encoding, unless the original JPEG is served as is, must not stall other viewers
+        encoded = await loop.run_in_executor(None, get_stream_jpeg, camera_id, profile)
+        if encoded is None or encoded.seq == last_seq:
+            continue
+        last_seq = encoded.seq
+        yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n\r\n' + encoded.data + b'\r\n')
+        if interval:
+            # Hold the stream to the viewer's frame rate cap
+            await asyncio.sleep(interval)
+
+class VideoFeedApp:
+    def __init__(self, wsgi_app):
+        """
+        ASGI application serving /video_feed streams natively and everything else through the WSGI app
+        Args:
+            wsgi_app: The Flask application handling all other routes
+        """
+        self.wsgi = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = VIDEO_FEED_PATH.fullmatch(scope['path'])
+            if match:
+                params = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+                await self.video_feed(int(match.group(1)), params, receive, send)
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def video_feed(self, camera_id: int, params: dict, receive, send):
+        camera = camera_streams.get(camera_id)
+        if not camera:
+            await self._respond(send, 404, f"Camera {camera_id} not found")
+            return
+        try:
+            profile = parse_profile(params)
+        except ValueError as e:
+            await self._respond(send, 400, str(e))
+            return
+        if not acquire_viewer(camera_id):
+            await self._respond(send, 503, f"Too many viewers for camera {camera_id}", [(b'retry-after', b'5')])
+            return
+
+        logger.info(f"Serving video feed for camera {camera_id}: {camera.get('name', 'Unknown')}")
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': MJPEG_HEADERS})
+            async for part in mjpeg_frames(camera_id, profile, disconnected):
+                await send({'type': 'http.response.body', 'body': part, 'more_body': True})
+            if not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            pass  # The viewer went away mid-frame
+        finally:
+            watcher.cancel()
+            release_viewer(camera_id)
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected: asyncio.Event):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    @staticmethod
+    async def _respond(send, status: int, text: str, headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8'), *headers]})
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8')})
+
+def create_asgi_app(wsgi_app) -> VideoFeedApp:
+    """Wrap the Flask app for serving under an ASGI server such as uvicorn"""
+    return VideoFeedApp(wsgi_app)
@@ -0,0 +1,92 @@
+import os
+import cv2
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import numpy as np
+from src.face_service import FaceService
+from src.face_tracker import FaceTracker
+
+# Seconds before an unseen face track is dropped, and between re-recognitions of a track
+TRACK_MAX_AGE = float(os.getenv("TRACK_MAX_AGE", 3))
+TRACK_RECONFIRM_INTERVAL = float(os.getenv("TRACK_RECONFIRM_INTERVAL", 15))
+
+# Re-run HOG face detection inside Haar boxes before encoding (slow, opt-in fallback)
+FACE_REDETECT = os.getenv("FACE_REDETECT", "false").lower() in ("1", "true", "yes")
+
+class CameraAnalyzer:
+    def __init__(self, camera_id: int, face_service: FaceService):
+        """Face detection, tracking and recognition state for one camera"""
+        self.camera_id = camera_id
+        self.face_service = face_service
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_tracker = FaceTracker(max_age=TRACK_MAX_AGE, reconfirm_interval=TRACK_RECONFIRM_INTERVAL)
+
+    def detect(self, frame: np.ndarray, roi: Optional[Tuple[int, int, int, int]] = None):
+        """Find face boxes (x, y, w, h) with the Haar cascade, only inside roi if given"""
+        x, y = 0, 0
+        if roi is not None:
+            x, y, w, h = roi
+            if w < 30 or h < 30:
+                return np.empty((0, 4), dtype=np.int32)
+            frame = frame[y:y+h, x:x+w]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        if len(faces) > 0 and (x or y):
+            faces = faces + np.array([x, y, 0, 0], dtype=faces.dtype)
+        return faces
+
+    def recognize(self, frame: np.ndarray, faces, timestamp: int) -> Optional[Dict]:
+        """
+        Track detected faces and recognize those on new tracks (or due for reconfirmation)
+        Returns:
+            An upload job for the upload service with one image per new track, or None
+        """
+        camera_id = self.camera_id
+        tracks = self.face_tracker.update(faces)
+        pending = [i for i, track in enumerate(tracks) if self.face_tracker.needs_recognition(track)]
+        if not pending:
+            return None
+
+        # Recognize those faces in one batch, without a second HOG pass
+        matches = self.face_service.recognize_faces(frame, [faces[i] for i in pending], redetect=FACE_REDETECT)
+        images = []
+        alert_tracks = []
+        for i, match in zip(pending, matches):
+            track = tracks[i]
+            if not self.face_tracker.set_match(track, match):
+                continue
+            x, y, w, h = match.box
+            face_image_name = f"camera_{camera_id}_time_{timestamp}_track_{track.track_id}.jpg"
+            # Keep the crop in memory; it only touches the disk if the upload has to be spooled
+            ret, buffer = cv2.imencode('.jpg', frame[y:y+h, x:x+w])
+            if not ret:
+                print(f"Failed to encode face of track {track.track_id} from camera {camera_id}")
+                continue
+            images.append({
+                'name': face_image_name,
+                'data': buffer.tobytes(),
+                'unknown': match.is_unknown,
+                'track_id': track.track_id
+            })
+            if match.is_unknown and not track.notified:
+                track.notified = True
+                alert_tracks.append(track.track_id)
+        if not images:
+            return None
+
+        unknown_count = sum(1 for image in images if image['unknown'])
+        # All new tracks of the frame make one event, notifying if an unknown face
+        # appeared on a track that has not raised an alert yet
+        return {
+            'camera_id': camera_id,
+            'image_type': "face",
+            'images': images,
+            'timestamp': timestamp,
+            'print_message': f"Camera {camera_id} - {len(images)} Face(s), {unknown_count} Unknown Detected - ",
+            'notify': bool(alert_tracks),
+            'notify_key': f"camera_{camera_id}_track_{alert_tracks[0]}" if alert_tracks else None
+        }
+
+def event_timestamp() -> int:
+    """Timestamp format used in event records and image names"""
+    return int(datetime.now().strftime("%Y%m%d%H%M%S"))
@@ -0,0 +1,142 @@
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+from src.network_scanner import load_mac_config
+
+logger = logging.getLogger(__name__)
+
+class CameraWorker:
+    def __init__(self, camera: dict, camera_id: int, thread: threading.Thread, stop_event: threading.Event):
+        """A running capture thread and the event that stops it"""
+        self.camera = camera
+        self.camera_id = camera_id
+        self.thread = thread
+        self.stop_event = stop_event
+
+class CameraSupervisor:
+    def __init__(self, run_camera: Callable[[dict, int, threading.Event], None],
+                 on_start: Optional[Callable[[dict], None]] = None,
+                 on_stop: Optional[Callable[[dict], None]] = None):
+        """
+        Start and stop one capture thread per camera as cameras come and go
+        Camera IDs follow the order of cameras in the MAC configuration, so a camera
+        keeps its ID (and its /video_feed URL) across reconnects and restarts.
+        Args:
+            run_camera: Capture loop, called as run_camera(camera, camera_id, stop_event) on its own thread
+            on_start: Called with the camera info after its thread is started
+            on_stop: Called with the camera info after its thread is asked to stop
+        """
+        self.run_camera = run_camera
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self.workers: Dict[str, CameraWorker] = {}
+        self.camera_ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Serialise starting and stopping each camera across callers (startup, discovery
+        # events, background reconcile) so a camera never gets two capture threads
+        self._camera_locks: Dict[str, threading.Lock] = {}
+        self._stopped = False
+        try:
+            camera_macs = [device['mac'].lower() for device in load_mac_config()['devices']
+                           if device.get('role') == 'camera']
+            self.camera_ids = {mac: camera_id for camera_id, mac in enumerate(camera_macs, 1)}
+        except Exception as e:
+            logger.error(f"Could not load camera IDs from MAC config: {e}")
+
+    def camera_id(self, mac: str) -> int:
+        """Stable ID of the camera with this MAC; unconfigured cameras get the next free one"""
+        with self._lock:
+            camera_id = self.camera_ids.get(mac)
+            if camera_id is None:
+                camera_id = self.camera_ids[mac] = max(self.camera_ids.values(), default=0) + 1
+            return camera_id
+
+    def _camera_lock(self, mac: str) -> threading.Lock:
+        with self._lock:
+            return self._camera_locks.setdefault(mac, threading.Lock())
+
+    def start_camera(self, camera: dict):
+        """Start capturing from a camera, restarting its worker if the camera moved"""
+        mac = camera['mac']
+        camera_id = self.camera_id(mac)
+        with self._camera_lock(mac):
+            with self._lock:
+                if self._stopped:
+                    return
+                worker = self.workers.get(mac)
+                if worker is not None and worker.thread.is_alive():
+                    if worker.camera['ip'] == camera['ip'] and worker.camera['port'] == camera['port']:
+                        return
+                    logger.info(f"Camera {camera['name']} moved from {worker.camera['ip']} to {camera['ip']}, restarting")
+                else:
+                    worker = None
+
+            if worker is not None:
+                self._stop_worker(worker)
+
+            stop_event = threading.Event()
+            thread = threading.Thread(target=self._run, args=(camera, camera_id, stop_event),
+                                      name=f"camera-{camera_id}", daemon=True)
+            with self._lock:
+                if self._stopped:
+                    return
+                self.workers[mac] = CameraWorker(camera, camera_id, thread, stop_event)
+            thread.start()
+            logger.info(f"Started camera {camera_id}: {camera['name']} at {camera['ip']}")
+            if self.on_start is not None:
+                self.on_start(camera)
+
+    def _run(self, camera: dict, camera_id: int, stop_event: threading.Event):
+        try:
+            self.run_camera(camera, camera_id, stop_event)
+        except Exception as e:
+            logger.error(f"Camera {camera_id} worker failed: {e}", exc_info=True)
+
+    def stop_camera(self, mac: str, timeout: float = 10):
+        """Stop capturing from a camera"""
+        with self._camera_lock(mac):
+            with self._lock:
+                worker = self.workers.pop(mac, None)
+            if worker is not None:
+                self._stop_worker(worker, timeout)
+
+    def _stop_worker(self, worker: CameraWorker, timeout: float = 10):
+        worker.stop_event.set()
+        if worker.thread is not threading.current_thread():
+            worker.thread.join(timeout=timeout)
+            if worker.thread.is_alive():
+                logger.warning(f"Camera {worker.camera_id} did not stop within {timeout}s")
+        logger.info(f"Stopped camera {worker.camera_id}: {worker.camera['name']}")
+        if self.on_stop is not None:
+            self.on_stop(worker.camera)
+
+    def handle_event(self, event):
+        """DiscoveryService subscriber: follow cameras appearing, moving and disappearing"""
+        if event.role != 'camera':
+            return
+        camera = {key: value for key, value in event.device.items() if key != 'role'}
+        if event.kind == 'removed':
+            self.stop_camera(camera['mac'])
+        else:
+            self.start_camera(camera)
+
+    def reconcile(self, devices: dict):
+        """Start cameras found by a full scan that are not running yet or have moved"""
+        for camera in devices.get('cameras', []):
+            self.start_camera(camera)
+
+    def running(self) -> List[dict]:
+        """Info of the cameras with a live capture thread"""
+        with self._lock:
+            return [worker.camera for worker in self.workers.values() if worker.thread.is_alive()]
+
+    def stop_all(self, timeout: float = 10):
+        """Stop every capture thread; cameras are not started again afterwards"""
+        with self._lock:
+            self._stopped = True
+            workers = list(self.workers.values())
+            self.workers.clear()
+        for worker in workers:
+            worker.stop_event.set()
+        for worker in workers:
+            self._stop_worker(worker, timeout)
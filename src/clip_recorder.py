@@ -0,0 +1,382 @@
+import os
+import time
+import itertools
+import threading
+import logging
+from collections import deque
+from queue import Queue, Empty
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Seconds of video kept before and after an event
+CLIP_PRE_SECONDS = float(os.getenv("CLIP_PRE_SECONDS", 5))
+CLIP_POST_SECONDS = float(os.getenv("CLIP_POST_SECONDS", 5))
+# Longest clip; events still going on when it is reached start a new clip
+CLIP_MAX_SECONDS = float(os.getenv("CLIP_MAX_SECONDS", 60))
+# Memory each camera may hold for clips: the rolling pre-event buffer plus frames of the
+# clip being recorded that the writer has not written yet, unless the camera's MAC
+# configuration sets "clip_buffer_mb"
+CLIP_BUFFER_MB = float(os.getenv("CLIP_BUFFER_MB", 8))
+# "mjpeg" concatenates the JPEGs as received; "avi" and "mp4" go through cv2.VideoWriter
+CLIP_FORMAT = os.getenv("CLIP_FORMAT", "mjpeg")
+CLIP_DIR = os.getenv("CLIP_DIR", "clips")
+# JPEG quality of decoded frames, which are only encoded by the writer thread
+CLIP_JPEG_QUALITY = int(os.getenv("CLIP_JPEG_QUALITY", 90))
+# Oldest clips are deleted once CLIP_DIR holds more than this many MB, or once they are
+# older than this many days; 0 disables either limit
+CLIP_RETENTION_MB = float(os.getenv("CLIP_RETENTION_MB", 1024))
+CLIP_RETENTION_DAYS = float(os.getenv("CLIP_RETENTION_DAYS", 7))
+
+# FourCC used for each VideoWriter container
+VIDEO_CODECS = {'avi': 'MJPG', 'mp4': 'mp4v'}
+# Frames a VideoWriter clip collects to measure its frame rate before the file is opened
+FPS_SAMPLE_FRAMES = 10
+
+# Capture time and frame of one buffered frame: the camera's JPEG bytes, or a decoded image
+Frame = Tuple[float, Union[bytes, np.ndarray]]
+
+def _frame_size(data: Union[bytes, np.ndarray]) -> int:
+    return data.nbytes if isinstance(data, np.ndarray) else len(data)
+
+class _OpenClip:
+    def __init__(self, camera_id: int, reason: str, on_written: Callable[[int], None]):
+        """Writer-side state of a clip being recorded"""
+        self.camera_id = camera_id
+        self.reason = reason
+        self.on_written = on_written
+        self.base: Optional[str] = None
+        self.temp_path: Optional[str] = None
+        self.file = None
+        self.video: Optional[cv2.VideoWriter] = None
+        self.held: List[Frame] = []  # Frames waiting for the frame rate to be known
+        self.frames = 0
+        self.error: Optional[Exception] = None
+
+class ClipWriter:
+    def __init__(self, output_dir: str = CLIP_DIR, clip_format: str = CLIP_FORMAT,
+                 max_bytes: int = int(CLIP_RETENTION_MB * 1024 * 1024), max_age: float = CLIP_RETENTION_DAYS * 86400):
+        """
+        Write clips to disk on a background thread as their frames arrive
+        Recorders open a clip, stream its frames and close it; frames are encoded here,
+        never on a capture thread. Memory is bounded by each recorder, which counts the
+        frames it queued until the writer reports them written.
+        Args:
+            output_dir: Directory clips are written to
+            clip_format: "mjpeg", "avi" or "mp4"
+            max_bytes: Total size of output_dir beyond which the oldest clips are deleted; 0 for no limit
+            max_age: Seconds after which clips are deleted; 0 keeps them
+        """
+        if clip_format != 'mjpeg' and clip_format not in VIDEO_CODECS:
+            raise ValueError(f"Unknown clip format: {clip_format}")
+        self.output_dir = output_dir
+        self.clip_format = clip_format
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.queue = Queue()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self._clips: Dict[int, _OpenClip] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.stats = {'written': 0, 'failed': 0, 'pruned': 0}
+
+    def start(self):
+        """Start the writer thread"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Clips left half written by a crash are never completed
+        for name in os.listdir(self.output_dir):
+            if name.startswith('camera_') and '.tmp.' in name:
+                try:
+                    os.remove(os.path.join(self.output_dir, name))
+                except OSError as e:
+                    logger.warning(f"Could not remove unfinished clip {name}: {e}")
+        self._prune()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="clip-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Write the frames still queued and finish open clips, then stop"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+
+    def open(self, camera_id: int, reason: str, frames: List[Frame], on_written: Callable[[int], None]) -> int:
+        """
+        Start a clip with its pre-event frames
+        Args:
+            on_written: Called from the writer thread with the size of each queued frame once
+                it no longer holds it
+        Returns:
+            The clip's id for add() and close()
+        """
+        clip_id = next(self._ids)
+        self.queue.put(('open', clip_id, (camera_id, reason, on_written)))
+        for frame in frames:
+            self.queue.put(('frame', clip_id, frame))
+        return clip_id
+
+    def add(self, clip_id: int, frame: Frame):
+        """Queue a frame of an open clip"""
+        self.queue.put(('frame', clip_id, frame))
+
+    def close(self, clip_id: int, reason: str):
+        """Finish a clip, named after reason"""
+        self.queue.put(('close', clip_id, reason))
+
+    def _run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            try:
+                kind, clip_id, value = self.queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if kind == 'open':
+                self._clips[clip_id] = _OpenClip(*value)
+            elif kind == 'frame':
+                clip = self._clips.get(clip_id)
+                if clip is not None:
+                    self._write_frame(clip, value)
+            else:
+                clip = self._clips.pop(clip_id, None)
+                if clip is not None:
+                    clip.reason = value
+                    self._finish(clip)
+        # Recorders still running at shutdown get their clips finished as they are
+        for clip in self._clips.values():
+            self._finish(clip)
+        self._clips.clear()
+
+    def _write_frame(self, clip: _OpenClip, frame: Frame):
+        if clip.error is None and self.clip_format != 'mjpeg':
+            # Held frames are reported written by _flush_video
+            clip.held.append(frame)
+            if len(clip.held) >= FPS_SAMPLE_FRAMES or clip.video is not None:
+                try:
+                    self._flush_video(clip)
+                except Exception as e:
+                    clip.error = e
+            return
+        try:
+            if clip.error is None:
+                if clip.base is None:
+                    self._create(clip, frame[0])
+                self._write_jpeg(clip, frame)
+        except Exception as e:
+            clip.error = e
+        finally:
+            clip.on_written(_frame_size(frame[1]))
+
+    def _create(self, clip: _OpenClip, timestamp: float):
+        start = time.strftime("%Y%m%d%H%M%S", time.localtime(timestamp))
+        clip.base = os.path.join(self.output_dir, f"camera_{clip.camera_id}_time_{start}")
+        # VideoWriter picks the container from the extension, so keep it on the temporary file
+        clip.temp_path = f"{clip.base}.{id(clip):x}.tmp.{self.clip_format}"
+        if self.clip_format == 'mjpeg':
+            clip.file = open(clip.temp_path, 'wb')
+
+    def _write_jpeg(self, clip: _OpenClip, frame: Frame):
+        # The camera's JPEGs back to back: a raw MJPEG file, without re-encoding
+        data = frame[1]
+        if isinstance(data, np.ndarray):
+            ret, buffer = cv2.imencode('.jpg', data, [cv2.IMWRITE_JPEG_QUALITY, CLIP_JPEG_QUALITY])
+            if not ret:
+                return
+            data = buffer.tobytes()
+        clip.file.write(data)
+        clip.frames += 1
+
+    def _flush_video(self, clip: _OpenClip):
+        """Write held frames, opening the VideoWriter at the frame rate they were captured at"""
+        held, clip.held = clip.held, []
+        try:
+            if clip.base is None:
+                self._create(clip, held[0][0])
+            for timestamp, data in held:
+                image = data if isinstance(data, np.ndarray) else \
+                    cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    continue
+                if clip.video is None:
+                    duration = held[-1][0] - held[0][0]
+                    fps = (len(held) - 1) / duration if duration > 0 else 5.0
+                    height, width = image.shape[:2]
+                    fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODECS[self.clip_format])
+                    clip.video = cv2.VideoWriter(clip.temp_path, fourcc, fps, (width, height))
+                    if not clip.video.isOpened():
+                        raise IOError(f"VideoWriter could not open {clip.temp_path}")
+                clip.video.write(image)
+                clip.frames += 1
+        finally:
+            for _, data in held:
+                clip.on_written(_frame_size(data))
+
+    def _finish(self, clip: _OpenClip):
+        try:
+            if clip.held:
+                self._flush_video(clip)
+        except Exception as e:
+            clip.error = e
+        if clip.file is not None:
+            clip.file.close()
+        if clip.video is not None:
+            clip.video.release()
+        if clip.temp_path is None:
+            return
+
+        if clip.error is None and clip.frames:
+            path = f"{clip.base}_{clip.reason}.{self.clip_format}"
+            os.replace(clip.temp_path, path)
+            with self._lock:
+                self.stats['written'] += 1
+            logger.info(f"Wrote {clip.frames}-frame {clip.reason} clip of camera {clip.camera_id} to {path}")
+        else:
+            if os.path.exists(clip.temp_path):
+                os.remove(clip.temp_path)
+            if clip.error is not None:
+                with self._lock:
+                    self.stats['failed'] += 1
+                logger.error(f"Failed to write {clip.reason} clip of camera {clip.camera_id}: {clip.error}")
+        self._prune()
+
+    def _prune(self):
+        """Delete the oldest clips beyond the size and age limits (writer thread)"""
+        if not self.max_bytes and not self.max_age:
+            return
+        clips = []
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if not name.startswith('camera_') or '.tmp.' in name:
+                continue
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            clips.append((info.st_mtime, info.st_size, path))
+        clips.sort()
+
+        total = sum(size for _, size, _ in clips)
+        cutoff = time.time() - self.max_age
+        pruned = 0
+        # The newest clip is kept even if it alone exceeds the size limit
+        for modified, size, path in clips[:-1]:
+            too_old = self.max_age and modified < cutoff
+            if not too_old and (not self.max_bytes or total <= self.max_bytes):
+                break
+            try:
+                os.remove(path)
+                total -= size
+                pruned += 1
+            except OSError as e:
+                logger.warning(f"Could not delete old clip {path}: {e}")
+        if pruned:
+            with self._lock:
+                self.stats['pruned'] += pruned
+            logger.info(f"Deleted {pruned} old clip(s) from {self.output_dir}")
+
+class ClipRecorder:
+    def __init__(self, camera_id: int, writer: ClipWriter, max_bytes: int,
+                 pre_seconds: float = CLIP_PRE_SECONDS, post_seconds: float = CLIP_POST_SECONDS,
+                 max_seconds: float = CLIP_MAX_SECONDS):
+        """
+        Rolling buffer of a camera's recent frames, streamed to the writer as a clip when an event fires
+        Camera JPEGs are kept as received and decoded frames as they are; the writer
+        encodes them, so the capture thread never does.
+        Args:
+            writer: Writes clips off the capture thread
+            max_bytes: Memory cap for the pre-event buffer plus the frames queued to the writer;
+                the oldest buffered frames go first, then clip frames are dropped while the writer is behind
+            pre_seconds: Seconds of video kept before an event
+            post_seconds: Seconds recorded after the last trigger of an event
+            max_seconds: Longest clip before it is cut and a new one started
+        """
+        self.camera_id = camera_id
+        self.writer = writer
+        self.max_bytes = max_bytes
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_seconds = max_seconds
+        self.buffer: Deque[Frame] = deque()
+        self.buffered_bytes = 0
+        self.queued_bytes = 0  # Queued to the writer and not written yet
+        self.dropped = 0
+        self.clip_id: Optional[int] = None
+        self.clip_start = 0.0
+        self.reason = ''
+        self.deadline = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, data: Union[bytes, np.ndarray], timestamp: Optional[float] = None):
+        """Buffer a frame, given as JPEG bytes or a decoded image (capture thread)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        size = _frame_size(data)
+        with self._lock:
+            self.buffer.append((timestamp, data))
+            self.buffered_bytes += size
+            while self.buffer and (self.buffered_bytes + self.queued_bytes > self.max_bytes
+                                   or self.buffer[0][0] < timestamp - self.pre_seconds):
+                self.buffered_bytes -= _frame_size(self.buffer.popleft()[1])
+
+            if self.clip_id is None:
+                return
+            if self.queued_bytes + size > self.max_bytes:
+                # The writer is behind; skip frames rather than hold more memory
+                self.dropped += 1
+            else:
+                self.queued_bytes += size
+                self.writer.add(self.clip_id, (timestamp, data))
+            if timestamp >= self.deadline or timestamp - self.clip_start >= self.max_seconds:
+                self.writer.close(self.clip_id, self.reason)
+                self.clip_id = None
+                if timestamp < self.deadline:
+                    # The event is still going on: continue it in a new clip
+                    self._open(self.reason, [], timestamp)
+
+    def _open(self, reason: str, frames: List[Frame], start: float):
+        """Open a clip with the given frames (lock held)"""
+        self.queued_bytes += sum(_frame_size(data) for _, data in frames)
+        self.clip_id = self.writer.open(self.camera_id, reason, frames, self._written)
+        self.clip_start = start
+        self.reason = reason
+
+    def _written(self, size: int):
+        with self._lock:
+            self.queued_bytes -= size
+
+    def trigger(self, reason: str):
+        """Start a clip with the buffered pre-event frames, or extend the one being recorded"""
+        now = time.time()
+        with self._lock:
+            self.deadline = now + self.post_seconds
+            if self.clip_id is None:
+                frames = list(self.buffer)
+                self._open(reason, frames, frames[0][0] if frames else now)
+            elif reason != 'motion':
+                # Name the clip after its most significant event
+                self.reason = reason
+
+    def close(self):
+        """Finish the clip being recorded, e.g. when the camera stops"""
+        with self._lock:
+            if self.clip_id is not None:
+                self.writer.close(self.clip_id, self.reason)
+                self.clip_id = None
+
+    def stats(self) -> dict:
+        """Buffer usage for monitoring"""
+        with self._lock:
+            return {
+                'buffered_frames': len(self.buffer),
+                'buffered_bytes': self.buffered_bytes,
+                'queued_bytes': self.queued_bytes,
+                'max_bytes': self.max_bytes,
+                'dropped_frames': self.dropped,
+                'recording': self.clip_id is not None,
+                'reason': self.reason if self.clip_id is not None else None
+            }
+
+# Shared by every camera's recorder
+clip_writer = ClipWriter()
@@ -0,0 +1,163 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from queue import Empty, Full
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for an updated known-face database in worker processes
+KNOWN_FACES_RELOAD_INTERVAL = 30
+
+def default_worker_count(num_cameras: int) -> int:
+    """One worker per camera, capped at the number of CPU cores"""
+    return max(1, min(num_cameras, os.cpu_count() or 1))
+
+def _worker_main(worker_id: int, requests, results, stop_event):
+    """Entry point of a detection process: analyze the latest shared frame of each requested camera"""
+    # Heavy imports only happen inside the worker process
+    from src.face_service import FaceService
+
+    face_service = FaceService()
+    analyzers = {}
+    rings = {}
+    logger.info(f"Detection worker {worker_id} started (pid {os.getpid()})")
+
+    try:
+        _analyze_requests(worker_id, requests, results, stop_event, face_service, analyzers, rings)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for ring in rings.values():
+            ring.close()
+    logger.info(f"Detection worker {worker_id} stopped")
+
+def _analyze_requests(worker_id, requests, results, stop_event, face_service, analyzers, rings):
+    from src.frame_ring import FrameRing
+    from src.camera_analyzer import CameraAnalyzer
+
+    last_seq: Dict[int, int] = {}
+    last_reload = time.time()
+    while not stop_event.is_set():
+        if time.time() - last_reload >= KNOWN_FACES_RELOAD_INTERVAL:
+            face_service.reload_if_changed()
+            last_reload = time.time()
+
+        try:
+            camera_id, ring_name, ring_seq, timestamp, roi, submitted_at = requests.get(timeout=0.5)
+        except Empty:
+            continue
+
+        try:
+            ring = rings.get(camera_id)
+            if ring is None or ring.name != ring_name:
+                if ring is not None:
+                    ring.close()
+                ring = rings[camera_id] = FrameRing.attach(ring_name)
+
+            # The roi was found on this exact frame
+            seq = ring_seq
+            frame, _ = ring.read(ring_seq)
+            if frame is None:
+                # Overwritten while the request was queued; the roi no longer matches,
+                # so scan the whole of the latest frame
+                seq, frame, _ = ring.read_latest()
+                roi = None
+            if frame is None or seq == last_seq.get(camera_id):
+                continue
+            last_seq[camera_id] = seq
+
+            analyzer = analyzers.get(camera_id)
+            if analyzer is None:
+                analyzer = analyzers[camera_id] = CameraAnalyzer(camera_id, face_service)
+            started = time.time()
+            faces = analyzer.detect(frame, roi)
+            finished = time.time()
+            job = analyzer.recognize(frame, faces, timestamp) if len(faces) > 0 else None
+            results.put((camera_id, finished - submitted_at, finished - started, job))
+        except Exception as e:
+            logger.error(f"Detection worker {worker_id} failed on camera {camera_id}: {e}")
+
+class DetectionWorkerPool:
+    def __init__(self, num_workers: int, result_handler: Callable[[Dict], object], queue_size: int = 4,
+                 timing_handler: Optional[Callable[[int, float, float], object]] = None):
+        """
+        Run face detection and recognition in separate processes, reading frames from shared memory
+        Args:
+            num_workers: Number of worker processes; cameras are assigned to them round-robin
+            result_handler: Called in this process with each upload job a worker produces
+            queue_size: Pending analysis requests per worker before new ones are dropped
+            timing_handler: Called with (camera_id, latency, busy) seconds after each detection
+        """
+        self.num_workers = num_workers
+        self.result_handler = result_handler
+        self.timing_handler = timing_handler
+        self._context = multiprocessing.get_context('spawn')
+        self.requests = [self._context.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self.results = self._context.Queue()
+        self.stop_event = self._context.Event()
+        self.processes: List[multiprocessing.Process] = []
+        self.assignments: Dict[int, int] = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._result_thread = None
+
+    def start(self):
+        """Start the worker processes and the thread forwarding their results"""
+        for worker_id in range(self.num_workers):
+            process = self._context.Process(
+                target=_worker_main,
+                args=(worker_id, self.requests[worker_id], self.results, self.stop_event),
+                name=f"detection-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        self._result_thread = threading.Thread(target=self._forward_results, daemon=True)
+        self._result_thread.start()
+        logger.info(f"Started {self.num_workers} detection worker processes")
+
+    def _forward_results(self):
+        while not self.stop_event.is_set():
+            try:
+                camera_id, latency, busy, job = self.results.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                if self.timing_handler is not None:
+                    self.timing_handler(camera_id, latency, busy)
+                if job:
+                    self.result_handler(job)
+            except Exception as e:
+                logger.error(f"Error handling detection result: {e}")
+
+    def submit(self, camera_id: int, ring_name: str, ring_seq: int, timestamp: int, roi=None) -> bool:
+        """
+        Ask the camera's worker to analyze frame ring_seq of the ring, only inside roi if given;
+        dropped if the worker is behind
+        """
+        with self._lock:
+            worker_id = self.assignments.get(camera_id)
+            if worker_id is None:
+                worker_id = self.assignments[camera_id] = len(self.assignments) % self.num_workers
+        try:
+            self.requests[worker_id].put_nowait((camera_id, ring_name, ring_seq, timestamp, roi, time.time()))
+            return True
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def stop(self, timeout: float = 5):
+        """Stop the worker processes"""
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes.clear()
+        if self._result_thread:
+            self._result_thread.join(timeout=timeout)
+        logger.info("Detection worker processes stopped")
@@ -2,8 +2,11 @@ import socket
 from zeroconf import ServiceInfo, Zeroconf
 import logging
 import threading
-from typing import Dict, List, Optional
-from .network_scanner import scan_network_for_devices
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+from .network_scanner import (scan_network_for_devices, scan_cached_devices, read_neighbor_table,
+                              index_devices_by_mac, resolve_devices, load_device_cache,
+                              run_arp_scan, save_device_cache)
 import time
 import json
 import os
@@ -11,9 +14,26 @@ import os
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "passive" follows the kernel neighbor table and only runs arp-scan when configured
+# devices are missing; "scan" runs the full arp-scan every min_scan_interval
+DISCOVERY_MODE = os.getenv("DISCOVERY_MODE", "passive")
+# Minimum seconds between full scans looking for missing devices in passive mode
+FULL_SCAN_INTERVAL = float(os.getenv("FULL_SCAN_INTERVAL", 300))
+# Seconds before a device that failed verification at the same IP is probed again
+REPROBE_INTERVAL = float(os.getenv("REPROBE_INTERVAL", 60))
+
+# Discovery event kinds
+DEVICE_ADDED = 'added'
+DEVICE_REMOVED = 'removed'
+DEVICE_IP_CHANGED = 'ip_changed'
+
+# device is the resolved camera/sensor/server info; previous is the info it replaces
+DeviceEvent = namedtuple('DeviceEvent', ['kind', 'role', 'device', 'previous'])
+
 class DiscoveryService:
-    def __init__(self, port: int = 2003):
+    def __init__(self, port: int = 2003, io_hub=None):
         self.zeroconf = Zeroconf()
+        self.io_hub = io_hub  # Probes cameras concurrently when available
         self.port = port
         self.services = []
         self.running = False
@@ -22,6 +42,10 @@ class DiscoveryService:
         self.registered_cameras = {}  # Keep track of registered cameras
         self.last_scan_time = 0
         self.min_scan_interval = 30  # Minimum seconds between scans
+        self.last_full_scan_time = 0
+        self.known_devices: Dict[str, Dict] = {}  # MAC -> resolved device info with 'role'
+        self.failed_probes: Dict[str, tuple] = {}  # MAC -> (ip, time) of the last failed verification
+        self.subscribers: List[Callable[[DeviceEvent], None]] = []
         
         # Load MAC address configuration
         self.mac_config = self._load_mac_config()
@@ -140,29 +164,153 @@ class DiscoveryService:
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.settimeout(3)
-            result = s.connect_ex((camera_info['host'], camera_info['port']))
+            result = s.connect_ex((camera_info.get('host', camera_info.get('ip')), camera_info['port']))
             s.close()
             return result == 0
         except Exception as e:
             logger.error(f"Error checking camera {camera_info['name']}: {e}")
             return False
 
+    def unregister_camera(self, camera_info: Dict):
+        """Withdraw a camera's mDNS service."""
+        service_name = f"camera-{camera_info['name']}._smartcam._tcp.local."
+        info = self.registered_cameras.pop(service_name, None)
+        if info is None:
+            return
+        try:
+            self.zeroconf.unregister_service(info)
+            self.services.remove(info)
+            logger.info(f"Unregistered camera service: {camera_info['name']}")
+        except Exception as e:
+            logger.error(f"Failed to unregister camera service {service_name}: {e}")
+
+    def subscribe(self, callback: Callable[[DeviceEvent], None]):
+        """Call callback with a DeviceEvent whenever a configured device appears, moves or disappears"""
+        self.subscribers.append(callback)
+
+    def _emit(self, kind: str, device: Dict, previous: Optional[Dict] = None):
+        logger.info(f"Device {kind}: {device['name']} ({device['mac']}) at {device['ip']}")
+        event = DeviceEvent(kind, device['role'], device, previous)
+        for callback in self.subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error in discovery subscriber: {e}")
+
+    @staticmethod
+    def _flatten(result: Dict) -> Dict[str, Dict]:
+        """Resolved scan result as MAC -> device info tagged with its role"""
+        devices = {}
+        for role, key in (('camera', 'cameras'), ('sensor', 'sensors')):
+            for device in result.get(key, []):
+                devices[device['mac']] = dict(device, role=role)
+        if result.get('server'):
+            devices[result['server']['mac']] = dict(result['server'], role='server')
+        return devices
+
+    def _apply(self, resolved: Dict[str, Dict], gone: List[str]):
+        """Update known devices, emitting events and (un)registering cameras"""
+        for mac, device in resolved.items():
+            previous = self.known_devices.get(mac)
+            self.known_devices[mac] = device
+            self.failed_probes.pop(mac, None)
+            if previous is not None and previous['ip'] == device['ip']:
+                continue
+            if device['role'] == 'camera':
+                self.register_camera(dict(device))
+            if previous is None:
+                self._emit(DEVICE_ADDED, device)
+            else:
+                self._emit(DEVICE_IP_CHANGED, device, previous)
+        for mac in gone:
+            device = self.known_devices.pop(mac)
+            if device['role'] == 'camera':
+                self.unregister_camera(device)
+            self._emit(DEVICE_REMOVED, device)
+
+    def incremental_scan(self, discovered: Optional[Dict[str, Dict]] = None):
+        """
+        Diff the kernel neighbor table against known devices and verify only new or moved ones.
+        A full arp-scan only runs when configured devices are still missing, at most every
+        FULL_SCAN_INTERVAL seconds; it refreshes the neighbor table as a side effect.
+        Args:
+            discovered: MAC -> device found by a full scan, diffed instead of the neighbor table
+        """
+        configured = {device['mac'].lower(): device for device in self.mac_config.get('devices', [])}
+        if discovered is None:
+            discovered = index_devices_by_mac(read_neighbor_table())
+            full_scan_due = time.time() - self.last_full_scan_time >= FULL_SCAN_INTERVAL
+        else:
+            full_scan_due = False
+        neighbors = {mac: device for mac, device in discovered.items() if mac in configured}
+
+        now = time.time()
+        # The server is this machine, which never appears in its own neighbor table
+        missing = {mac for mac, device in configured.items()
+                   if device.get('role') != 'server' and mac not in neighbors}
+        if missing and full_scan_due:
+            logger.info(f"{len(missing)} configured device(s) not in neighbor table, running full scan")
+            self.last_full_scan_time = now
+            scanned = self._flatten(scan_network_for_devices())
+            self._apply(scanned, [])
+            neighbors.update({mac: {'mac': mac, 'ip': device['ip']} for mac, device in scanned.items()})
+
+        candidates = {}
+        for mac, neighbor in neighbors.items():
+            known = self.known_devices.get(mac)
+            if known is not None and known['ip'] == neighbor['ip']:
+                continue
+            failed = self.failed_probes.get(mac)
+            if failed and failed[0] == neighbor['ip'] and now - failed[1] < REPROBE_INTERVAL:
+                continue
+            candidates[mac] = neighbor
+        gone = [mac for mac, device in self.known_devices.items()
+                if device['role'] != 'server' and mac not in neighbors]
+
+        resolved = {}
+        if candidates:
+            config = {'devices': [configured[mac] for mac in candidates]}
+            resolved = self._flatten(resolve_devices(config, candidates))
+            for mac, neighbor in candidates.items():
+                if mac not in resolved:
+                    self.failed_probes[mac] = (neighbor['ip'], now)
+        self._apply(resolved, gone)
+
+    def full_scan(self):
+        """
+        Run arp-scan and diff its result against known devices, emitting events like
+        incremental_scan. Known cameras the scan missed are kept while they still accept
+        connections, since arp-scan can miss a device that is busy streaming.
+        """
+        discovered = run_arp_scan()
+        if not discovered:
+            logger.warning("Network scan found no devices; keeping known devices")
+            return
+        discovered_by_mac = index_devices_by_mac(discovered)
+        save_device_cache(discovered_by_mac, self.mac_config)
+
+        unseen = [device for mac, device in self.known_devices.items()
+                  if device['role'] == 'camera' and mac not in discovered_by_mac]
+        if unseen:
+            if self.io_hub is not None:
+                alive = self.io_hub.check_alive([(camera['ip'], camera['port']) for camera in unseen])
+            else:
+                alive = [self.check_camera_alive(camera) for camera in unseen]
+            for camera, is_alive in zip(unseen, alive):
+                if is_alive:
+                    discovered_by_mac[camera['mac']] = {'mac': camera['mac'], 'ip': camera['ip']}
+        self.incremental_scan(discovered_by_mac)
+
     def periodic_scan(self):
         """Periodically scan for cameras and update their status."""
         while self.running:
             try:
                 current_time = time.time()
-                if current_time - self.last_scan_time >= self.min_scan_interval:
-                    logger.info("Starting periodic camera scan")
-                    discovered_devices = scan_network_for_devices()
-                    
-                    if discovered_devices.get('cameras'):
-                        for camera in discovered_devices['cameras']:
-                            if self.check_camera_alive(camera):
-                                self.register_camera(camera)
-                            else:
-                                logger.warning(f"Camera {camera['name']} is not reachable")
-                    
+                if DISCOVERY_MODE == "passive":
+                    self.incremental_scan()
+                elif current_time - self.last_scan_time >= self.min_scan_interval:
+                    logger.info("Starting periodic device scan")
+                    self.full_scan()
                     self.last_scan_time = current_time
                     
                 time.sleep(5)  # Check every 5 seconds
@@ -180,7 +328,11 @@ class DiscoveryService:
                 return
                 
             self.running = True
-            discovered_devices = scan_network_for_devices()
+            # Announce cameras at their last known addresses; the periodic scan corrects them
+            discovered_devices = scan_cached_devices()
+            if discovered_devices is None:
+                discovered_devices = scan_network_for_devices()
+                self.last_full_scan_time = time.time()
             
             if not discovered_devices.get('cameras'):
                 logger.warning("No cameras found in network scan")
@@ -189,6 +341,13 @@ class DiscoveryService:
                 for camera in discovered_devices['cameras']:
                     logger.info(f"Processing camera: {camera.get('name', 'Unknown')}")
                     self.register_camera(camera)
+            self.known_devices = self._flatten(discovered_devices)
+            # Devices the startup pass already failed to verify wait REPROBE_INTERVAL like
+            # any other, rather than being probed again by the first incremental scan
+            started = time.time()
+            for mac, entry in load_device_cache().items():
+                if mac not in self.known_devices:
+                    self.failed_probes[mac] = (entry['ip'], started)
 
             # Start periodic scanning thread
             self.scan_thread = threading.Thread(target=self.periodic_scan)
@@ -0,0 +1,157 @@
+import threading
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIM = 128
+# Gallery size from which the k-means bucketed index is used instead of a full scan
+APPROXIMATE_MIN_SIZE = 4000
+
+class FaceIndex:
+    def __init__(self, dim: int = ENCODING_DIM, approximate_min_size: Optional[int] = APPROXIMATE_MIN_SIZE,
+                 n_probe: int = 4):
+        """
+        Known-face gallery stored as a contiguous float32 matrix
+        Args:
+            dim: Length of each face encoding
+            approximate_min_size: Gallery size from which k-means buckets are searched
+                instead of the whole matrix; None disables the approximate index
+            n_probe: Number of nearest buckets searched per query
+        """
+        self.dim = dim
+        self.approximate_min_size = approximate_min_size
+        self.n_probe = n_probe
+        self._lock = threading.RLock()
+        self._matrix = np.empty((16, dim), dtype=np.float32)
+        self._sq_norms = np.empty(16, dtype=np.float32)
+        self._size = 0
+        self.paths: List[str] = []
+
+        # Approximate index state
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._indexed_size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """View of the stored encodings, one row per known face"""
+        return self._matrix[:self._size]
+
+    def add(self, encoding: np.ndarray, path: str) -> int:
+        """Add an encoding and return its id"""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if self._size == len(self._matrix):
+                self._grow(self._size * 2)
+            face_id = self._size
+            self._matrix[face_id] = encoding
+            self._sq_norms[face_id] = encoding @ encoding
+            self.paths.append(path)
+            self._size += 1
+
+            if self._centroids is not None:
+                self._assignments = np.append(self._assignments, self._nearest_centroids(encoding[None], 1)[0, 0])
+            self._maybe_rebuild_approximate()
+            return face_id
+
+    def load(self, encodings, paths: List[str]):
+        """Replace the gallery with the given encodings and paths"""
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            self._size = len(matrix)
+            self._matrix = np.empty((max(16, self._size), self.dim), dtype=np.float32)
+            self._sq_norms = np.empty(len(self._matrix), dtype=np.float32)
+            self._matrix[:self._size] = matrix
+            self._sq_norms[:self._size] = np.einsum('ij,ij->i', matrix, matrix)
+            self.paths = list(paths)[:self._size]
+            self.paths += [''] * (self._size - len(self.paths))
+            self._centroids = None
+            self._assignments = None
+            self._indexed_size = 0
+            self._maybe_rebuild_approximate()
+
+    def match(self, encodings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the closest known face for each query encoding in one batched computation
+        Returns:
+            (ids, distances): best-match id per query (-1 if the gallery is empty)
+            and its euclidean distance (inf if the gallery is empty)
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.full(len(queries), -1, dtype=np.int64)
+        distances = np.full(len(queries), np.inf, dtype=np.float32)
+        if len(queries) == 0:
+            return ids, distances
+
+        with self._lock:
+            size = self._size
+            matrix = self._matrix[:size]
+            sq_norms = self._sq_norms[:size]
+            centroids = self._centroids
+            assignments = self._assignments
+        if size == 0:
+            return ids, distances
+
+        if centroids is None:
+            squared = self._squared_distances(queries, matrix, sq_norms)
+            ids[:] = np.argmin(squared, axis=1)
+            distances[:] = squared[np.arange(len(queries)), ids]
+        else:
+            probes = self._nearest_centroids(queries, self.n_probe, centroids)
+            for q, query in enumerate(queries):
+                candidates = np.flatnonzero(np.isin(assignments[:size], probes[q]))
+                if len(candidates) == 0:
+                    continue
+                squared = self._squared_distances(query[None], matrix[candidates], sq_norms[candidates])[0]
+                best = np.argmin(squared)
+                ids[q] = candidates[best]
+                distances[q] = squared[best]
+
+        return ids, np.sqrt(distances)
+
+    @staticmethod
+    def _squared_distances(queries: np.ndarray, matrix: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        squared = q_norms[:, None] + sq_norms[None, :] - 2.0 * (queries @ matrix.T)
+        return np.maximum(squared, 0.0)
+
+    def _grow(self, capacity: int):
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._matrix, self._sq_norms = matrix, sq_norms
+
+    def _nearest_centroids(self, queries: np.ndarray, count: int, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        centroids = self._centroids if centroids is None else centroids
+        c_norms = np.einsum('ij,ij->i', centroids, centroids)
+        squared = self._squared_distances(queries, centroids, c_norms)
+        count = min(count, len(centroids))
+        return np.argpartition(squared, count - 1, axis=1)[:, :count]
+
+    def _maybe_rebuild_approximate(self):
+        """(Re)build k-means buckets once the gallery is large, and again after it grows by half"""
+        if self.approximate_min_size is None or self._size < self.approximate_min_size:
+            return
+        if self._centroids is not None and self._size < self._indexed_size * 1.5:
+            return
+
+        data = self._matrix[:self._size]
+        n_clusters = max(1, int(np.sqrt(self._size)))
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(self._size, n_clusters, replace=False)].copy()
+        for _ in range(10):
+            assignments = self._nearest_centroids(data, 1, centroids)[:, 0]
+            for c in range(n_clusters):
+                members = data[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+        self._centroids = centroids
+        self._assignments = self._nearest_centroids(data, 1, centroids)[:, 0]
+        self._indexed_size = self._size
+        logger.info(f"Built approximate face index with {n_clusters} buckets over {self._size} faces")
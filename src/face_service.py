@@ -5,17 +5,25 @@ import face_recognition
 from typing import Dict, List, Tuple, Optional
 import pickle
 import logging
+from collections import namedtuple
 from datetime import datetime
 from face_unknown_notifier import FaceUnknownNotifier
+from face_index import FaceIndex
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximum distance between encodings for two faces to be considered the same person
+MATCH_TOLERANCE = 0.6
+
+# Recognition result for one face box; face_id is None for unknown faces
+FaceMatch = namedtuple('FaceMatch', ['box', 'encoding', 'face_id', 'distance', 'is_unknown'])
+
 class FaceService:
     def __init__(self, firebase_app=None):
-        self.known_face_encodings = []
-        self.known_face_paths = []
+        self.known_faces = FaceIndex()
         self.encodings_file = "faces/known_faces.pkl"
+        self.encodings_mtime = None
         self.notifier = FaceUnknownNotifier(firebase_app)
         self.load_known_faces()
 
@@ -23,10 +31,10 @@ class FaceService:
         """Load known face encodings from pickle file if it exists"""
         if os.path.exists(self.encodings_file):
             try:
+                self.encodings_mtime = os.path.getmtime(self.encodings_file)
                 with open(self.encodings_file, 'rb') as f:
                     data = pickle.load(f)
-                    self.known_face_encodings = data.get('encodings', [])
-                    self.known_face_paths = data.get('paths', [])
+                    self.known_faces.load(data.get('encodings', []), data.get('paths', []))
             except Exception as e:
                 print(f"Error loading known faces: {e}")
 
@@ -35,12 +43,25 @@ class FaceService:
         try:
             with open(self.encodings_file, 'wb') as f:
                 pickle.dump({
-                    'encodings': self.known_face_encodings,
-                    'paths': self.known_face_paths
+                    'encodings': self.known_faces.encodings.copy(),
+                    'paths': list(self.known_faces.paths)
                 }, f)
+            self.encodings_mtime = os.path.getmtime(self.encodings_file)
         except Exception as e:
             print(f"Error saving known faces: {e}")
 
+    def reload_if_changed(self) -> bool:
+        """Reload known faces if another process has saved a newer pickle file"""
+        try:
+            mtime = os.path.getmtime(self.encodings_file)
+        except OSError:
+            return False
+        if mtime == self.encodings_mtime:
+            return False
+        self.load_known_faces()
+        logger.info(f"Reloaded {len(self.known_faces)} known faces")
+        return True
+
     def add_known_face(self, face_image: np.ndarray, face_path: str) -> bool:
         """Add a known face to the database"""
         try:
@@ -54,15 +75,13 @@ class FaceService:
             face_encoding = face_recognition.face_encodings(rgb_image, face_locations)[0]
             
             # Check if face is already known
-            if self.known_face_encodings:
-                matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding)
-                if any(matches):
-                    logger.info(f"Face already exists in database: {face_path}")
-                    return False
+            face_id, distance = self.match_encoding(face_encoding)
+            if face_id is not None:
+                logger.info(f"Face already exists in database: {face_path}")
+                return False
             
             # Add to known faces
-            self.known_face_encodings.append(face_encoding)
-            self.known_face_paths.append(face_path)
+            self.known_faces.add(face_encoding, face_path)
             
             # Save updated encodings
             self.save_known_faces()
@@ -72,6 +91,80 @@ class FaceService:
             logger.error(f"Error adding known face: {e}")
             return False
 
+    def encode_faces(self, frame: np.ndarray, boxes, redetect: bool = False) -> List[Optional[np.ndarray]]:
+        """
+        Compute encodings for faces at precomputed boxes with a single face_encodings call
+        Args:
+            frame: Full BGR frame the boxes refer to
+            boxes: Face boxes as (x, y, w, h), e.g. from CascadeClassifier.detectMultiScale
+            redetect: Re-run HOG detection inside each box and encode the HOG location instead
+                (slower; fallback for detectors whose boxes are too loose)
+        Returns:
+            One encoding per box, None where redetect found no face
+        """
+        if len(boxes) == 0:
+            return []
+
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        locations = []
+        for (x, y, w, h) in boxes:
+            x, y, w, h = int(x), int(y), int(w), int(h)
+            location = (y, x + w, y + h, x)  # face_recognition uses (top, right, bottom, left)
+            if redetect:
+                found = face_recognition.face_locations(rgb_frame[y:y+h, x:x+w], model="hog")
+                if found:
+                    top, right, bottom, left = found[0]
+                    location = (y + top, x + right, y + bottom, x + left)
+                else:
+                    location = None
+            locations.append(location)
+
+        valid_locations = [location for location in locations if location is not None]
+        if not valid_locations:
+            return [None] * len(locations)
+        encodings = iter(face_recognition.face_encodings(rgb_frame, valid_locations))
+        return [next(encodings) if location is not None else None for location in locations]
+
+    def match_encoding(self, face_encoding: np.ndarray, tolerance: float = MATCH_TOLERANCE) -> Tuple[Optional[int], float]:
+        """
+        Find the closest known face for an encoding
+        Returns:
+            (face_id, distance): face_id is None if no known face is within tolerance
+        """
+        ids, distances = self.known_faces.match(face_encoding)
+        distance = float(distances[0])
+        if ids[0] < 0 or distance > tolerance:
+            return None, distance
+        return int(ids[0]), distance
+
+    def recognize_faces(self, frame: np.ndarray, boxes, redetect: bool = False,
+                        tolerance: float = MATCH_TOLERANCE) -> List[FaceMatch]:
+        """
+        Recognize all faces of one frame: one colour conversion, one face_encodings
+        call and one vectorized comparison against the known faces
+        Args:
+            frame: Full BGR frame the boxes refer to
+            boxes: Face boxes as (x, y, w, h)
+            redetect: See encode_faces
+        Returns:
+            One FaceMatch per box, in order; faces that could not be encoded are unknown
+        """
+        encodings = self.encode_faces(frame, boxes, redetect=redetect)
+        valid = [i for i, encoding in enumerate(encodings) if encoding is not None]
+        face_ids = [None] * len(encodings)
+        distances = [float('inf')] * len(encodings)
+        if valid:
+            ids, dists = self.known_faces.match(np.stack([encodings[i] for i in valid]))
+            for i, face_id, distance in zip(valid, ids, dists):
+                distances[i] = float(distance)
+                if face_id >= 0 and distance <= tolerance:
+                    face_ids[i] = int(face_id)
+
+        return [
+            FaceMatch(tuple(int(v) for v in box), encoding, face_id, distance, face_id is None)
+            for box, encoding, face_id, distance in zip(boxes, encodings, face_ids, distances)
+        ]
+
     def is_face_unknown(self, face_image: np.ndarray, notify: bool = True, image_path: Optional[str] = None) -> bool:
         """
         Check if a face is unknown by comparing with known faces
@@ -80,32 +173,30 @@ class FaceService:
             notify: Whether to send a notification if face is unknown
             image_path: Path to the image file (required for notifications)
         """
-        if not self.known_face_encodings:
+        if not len(self.known_faces):
             logger.info("No known faces in database, treating face as unknown")
             if notify and image_path:
                 self.notifier.notify_unknown_face(image_path, datetime.now().isoformat())
             return True
 
         try:
-            # Get face encoding
-            rgb_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_image, model="hog")
-            if not face_locations:
+            # Get face encoding, locating the face inside the crop with HOG
+            height, width = face_image.shape[:2]
+            face_encoding = self.encode_faces(face_image, [(0, 0, width, height)], redetect=True)[0]
+            if face_encoding is None:
                 logger.warning("No face detected in image")
                 return True
             
-            face_encoding = face_recognition.face_encodings(rgb_image, face_locations)[0]
-            
-            # Compare with known faces using a slightly higher tolerance for better reliability
-            matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.6)
-            is_unknown = not any(matches)
+            # Compare with all known faces in one batched distance computation
+            face_id, distance = self.match_encoding(face_encoding)
+            is_unknown = face_id is None
             
             if is_unknown:
                 logger.info("Unknown face detected")
                 if notify and image_path:
                     self.notifier.notify_unknown_face(image_path, datetime.now().isoformat())
             else:
-                logger.info("Known face detected")
+                logger.info(f"Known face detected: {self.known_faces.paths[face_id]} (distance {distance:.3f})")
                 
             return is_unknown
 
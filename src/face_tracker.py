@@ -0,0 +1,111 @@
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class Track:
+    def __init__(self, track_id: int, box: Tuple[int, int, int, int], now: float):
+        """A face followed across detections"""
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.match = None            # Latest FaceMatch from recognition
+        self.last_recognized = None  # Time of the latest recognition
+        self.notified = False        # Whether an unknown face alert was raised for the track
+
+def iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+def centroid_distance(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    """Distance between box centres, relative to the larger box size"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    distance = np.hypot((ax + aw / 2) - (bx + bw / 2), (ay + ah / 2) - (by + bh / 2))
+    return distance / max(aw, ah, bw, bh, 1)
+
+class FaceTracker:
+    def __init__(self, iou_threshold: float = 0.3, max_centroid_distance: float = 1.0,
+                 max_age: float = 3.0, reconfirm_interval: float = 15.0):
+        """
+        IoU/centroid tracker assigning stable ids to face boxes of one camera
+        Args:
+            iou_threshold: Minimum IoU to associate a box with an existing track
+            max_centroid_distance: Fallback association for boxes that moved too far for IoU,
+                as centre distance relative to box size
+            max_age: Seconds after which an unseen track is dropped
+            reconfirm_interval: Seconds after which a track is recognized again
+        """
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_age = max_age
+        self.reconfirm_interval = reconfirm_interval
+        self.tracks: Dict[int, Track] = {}
+        self._next_id = 1
+
+    def update(self, boxes, now: Optional[float] = None) -> List[Track]:
+        """Associate detected (x, y, w, h) boxes with tracks; returns one track per box, in order"""
+        now = time.time() if now is None else now
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+
+        # Forget tracks that have not been seen recently
+        for track_id in [tid for tid, track in self.tracks.items() if now - track.last_seen > self.max_age]:
+            del self.tracks[track_id]
+
+        # Greedy association: best IoU pairs first, then nearest centroids
+        candidates = []
+        for b, box in enumerate(boxes):
+            for track in self.tracks.values():
+                overlap = iou(box, track.box)
+                if overlap >= self.iou_threshold:
+                    candidates.append((0, -overlap, b, track.track_id))
+                else:
+                    distance = centroid_distance(box, track.box)
+                    if distance <= self.max_centroid_distance:
+                        candidates.append((1, distance, b, track.track_id))
+        candidates.sort()
+
+        assigned: List[Optional[Track]] = [None] * len(boxes)
+        used_tracks = set()
+        for _, _, b, track_id in candidates:
+            if assigned[b] is not None or track_id in used_tracks:
+                continue
+            track = self.tracks[track_id]
+            track.box = boxes[b]
+            track.last_seen = now
+            track.hits += 1
+            assigned[b] = track
+            used_tracks.add(track_id)
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                track = Track(self._next_id, box, now)
+                self._next_id += 1
+                self.tracks[track.track_id] = track
+                assigned[b] = track
+                logger.debug(f"New face track {track.track_id} at {box}")
+        return assigned
+
+    def needs_recognition(self, track: Track, now: Optional[float] = None) -> bool:
+        """New tracks are recognized once, then again every reconfirm_interval seconds"""
+        now = time.time() if now is None else now
+        return track.last_recognized is None or now - track.last_recognized >= self.reconfirm_interval
+
+    def set_match(self, track: Track, match, now: Optional[float] = None) -> bool:
+        """Store a recognition result; returns True if it should produce an event for the track"""
+        now = time.time() if now is None else now
+        previous = track.match
+        track.match = match
+        track.last_recognized = now
+        # One event per track, plus one if a reconfirmation changes who it is
+        return previous is None or previous.face_id != match.face_id
@@ -1,6 +1,6 @@
 import logging
 from typing import Optional
-from firebase_admin import messaging
+from src.notification_aggregator import aggregator
 
 logger = logging.getLogger(__name__)
 
@@ -9,26 +9,22 @@ class FaceUnknownNotifier:
         """Initialize the notifier with Firebase app instance"""
         self.firebase_app = firebase_app
 
-    def notify_unknown_face(self, image_path: str, timestamp: Optional[str] = None) -> bool:
-        """Send a notification when an unknown face is detected"""
+    def notify_unknown_face(self, image_path: str, timestamp: Optional[str] = None, key: str = 'unknown_face') -> bool:
+        """Queue a notification when an unknown face is detected; repeats for the same key are coalesced"""
         try:
-            # Create message
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title='Unknown Person Detected',
-                    body=f'An unknown person was detected at {timestamp if timestamp else "the premises"}.'
-                ),
+            queued = aggregator.notify(
+                key,
+                title='Unknown Person Detected',
+                body=f'An unknown person was detected at {timestamp if timestamp else "the premises"}.',
+                topic='security_alerts',  # All devices subscribed to this topic will receive the notification
                 data={
                     'type': 'unknown_face',
                     'image_path': image_path,
                     'timestamp': timestamp or '',
                 },
-                topic='security_alerts'  # All devices subscribed to this topic will receive the notification
+                app=self.firebase_app
             )
-            
-            # Send message
-            response = messaging.send(message, app=self.firebase_app)
-            logger.info(f'Successfully sent unknown face notification: {response}')
+            logger.info(f"Unknown face notification {'queued' if queued else 'coalesced'}")
             return True
             
         except Exception as e:
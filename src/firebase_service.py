@@ -1,7 +1,8 @@
 import firebase_admin
-from firebase_admin import credentials, db, storage, messaging, get_app
+from firebase_admin import credentials, db, storage, get_app
 import os
 from dotenv import load_dotenv
+from src.notification_aggregator import aggregator
 
 # Topic for face detection notifications
 FACE_NOTIFICATION_TOPIC = 'unknown_faces'
@@ -45,51 +46,56 @@ def get_firebase_app():
     except ValueError:
         return init_firebase()
 
-def send_notification(title: str, body: str, image_url: str = None):
-    """Send FCM notification to subscribed devices"""
+def send_notification(title: str, body: str, image_url: str = None, key: str = FACE_NOTIFICATION_TOPIC):
+    """
+    Queue an FCM notification to subscribed devices
+    Notifications sharing a key are coalesced and all alerts are sent in rate-limited batches.
+    """
     try:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
+        queued = aggregator.notify(
+            key,
+            title,
+            body,
+            topic=FACE_NOTIFICATION_TOPIC,
             data={
                 'image_url': image_url if image_url else ''
-            },
-            topic=FACE_NOTIFICATION_TOPIC,
+            }
         )
-        response = messaging.send(message)
-        print(f"Notification sent successfully: {response}")
+        print(f"Notification {'queued' if queued else 'coalesced'}: {title}")
         return True
     except Exception as e:
         print(f"Error sending notification: {e}")
         return False
 
+def _upload_blob(camera_id, image_name, image_path=None, image_data=None):
+    """Upload a JPEG, given as bytes or a local file, to Storage and return (storage_path, signed_url)"""
+    if image_data is None and not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+
+    # Get bucket with explicit project ID
+    bucket = storage.bucket()
+    
+    # Create storage path with timestamp for better organization
+    storage_path = f"camera_{camera_id}/{image_name}"
+    blob = bucket.blob(storage_path)
+    
+    # Upload with content type, straight from memory when possible
+    if image_data is not None:
+        blob.upload_from_string(image_data, content_type='image/jpeg')
+    else:
+        blob.upload_from_filename(image_path, content_type='image/jpeg')
+    
+    # Generate signed URL instead of public URL for better security
+    image_url = blob.generate_signed_url(
+        version='v4',
+        expiration=7200,  # 2 hours
+        method='GET'
+    )
+    return storage_path, image_url
+
 def upload_image_data(camera_id, image_type, image_path, image_name, timestamp, print_message, notify=False):
     try:
-        # Verify file exists
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found: {image_path}")
-
-        # Get bucket with explicit project ID
-        bucket = storage.bucket()
-        
-        # Create storage path with timestamp for better organization
-        storage_path = f"camera_{camera_id}/{image_name}"
-        blob = bucket.blob(storage_path)
-        
-        # Upload with content type
-        blob.upload_from_filename(
-            image_path,
-            content_type='image/jpeg'
-        )
-        
-        # Generate signed URL instead of public URL for better security
-        image_url = blob.generate_signed_url(
-            version='v4',
-            expiration=7200,  # 2 hours
-            method='GET'
-        )
+        storage_path, image_url = _upload_blob(camera_id, image_name, image_path=image_path)
 
         # Store metadata in Realtime Database
         data = {
@@ -111,7 +117,8 @@ def upload_image_data(camera_id, image_type, image_path, image_name, timestamp,
             send_notification(
                 "Unknown Face Detected",
                 f"An unknown face was detected by Camera {camera_id}",
-                image_url
+                image_url,
+                key=f"camera_{camera_id}"
             )
         
         # Clean up local file
@@ -121,3 +128,69 @@ def upload_image_data(camera_id, image_type, image_path, image_name, timestamp,
     except Exception as e:
         print(f"Firebase upload error for camera {camera_id}: {str(e)}")
         return False
+
+def upload_image_group(camera_id, image_type, images, timestamp, print_message, notify_key=None, notify=True):
+    """
+    Upload several images from one frame as a single grouped event
+    Args:
+        images: List of dicts with 'name' and 'unknown' keys and either the encoded
+            JPEG bytes under 'data' or a local file under 'path' (removed once uploaded),
+            and optionally a 'track_id'
+        notify_key: Notification coalescing key, defaults to the camera
+        notify: Whether unknown faces in the group raise a notification
+    Pushes one database record listing every image and sends at most one notification.
+    """
+    try:
+        uploaded = []
+        for image in images:
+            storage_path, image_url = _upload_blob(
+                camera_id, image['name'], image_path=image.get('path'), image_data=image.get('data'))
+            uploaded.append({
+                'imageUrl': image_url,
+                'imageName': image['name'],
+                'storagePath': storage_path,
+                'unknown': bool(image['unknown'])
+            })
+            if image.get('track_id') is not None:
+                uploaded[-1]['trackId'] = image['track_id']
+
+        if not uploaded:
+            return True
+
+        # Top-level image fields point at the first unknown face so existing clients keep working
+        unknown = [image for image in uploaded if image['unknown']]
+        primary = unknown[0] if unknown else uploaded[0]
+        data = {
+            'cameraId': camera_id,
+            'imageType': image_type,
+            'imageUrl': primary['imageUrl'],
+            'imageName': primary['imageName'],
+            'timestamp': timestamp,
+            'storagePath': primary['storagePath'],
+            'faceCount': len(uploaded),
+            'unknownCount': len(unknown),
+            'images': uploaded
+        }
+
+        ref = db.reference('images').child(f"camera_{camera_id}")
+        ref.push(data)
+
+        print(f"{print_message}Uploaded {len(uploaded)} images to: camera_{camera_id}/")
+
+        if unknown and notify:
+            send_notification(
+                "Unknown Face Detected",
+                f"{len(unknown)} unknown face{'s were' if len(unknown) > 1 else ' was'} detected by Camera {camera_id}",
+                primary['imageUrl'],
+                key=notify_key or f"camera_{camera_id}"
+            )
+
+        # Clean up local files
+        for image in images:
+            if image.get('path'):
+                os.remove(image['path'])
+        return True
+
+    except Exception as e:
+        print(f"Firebase group upload error for camera {camera_id}: {str(e)}")
+        return False
@@ -0,0 +1,246 @@
+import time
+import threading
+import logging
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+import cv2
+import numpy as np
+from src.frame_ring import FrameRing
+from src.frame_signal import FrameSignal
+
+logger = logging.getLogger(__name__)
+
+# Immutable JPEG buffer shared by every viewer of a camera
+EncodedFrame = namedtuple('EncodedFrame', ['seq', 'data', 'timestamp'])
+
+# Re-encoded variants (scale, quality) kept per camera, least recently used evicted first
+MAX_VARIANTS = 8
+
+class FrameBroadcaster:
+    def __init__(self, camera_id: int, jpeg_quality: int = 95, slots: int = 4,
+                 shared_name: Optional[str] = None):
+        """
+        Hold the latest frames of a camera and encode each to JPEG at most once
+        Args:
+            slots: Size of the frame ring buffer
+            shared_name: Keep frames in shared memory under this name prefix so other
+                processes can read them; None keeps them private to this process
+        """
+        self.camera_id = camera_id
+        self.jpeg_quality = jpeg_quality
+        self.slots = slots
+        self.shared_name = shared_name
+        self.ring: Optional[FrameRing] = None
+        self._generation = 0
+        self._seq_base = 0
+        self._lock = threading.Lock()
+        # Readers of each ring; a replaced ring is only closed once its last reader is done
+        self._readers: Dict[FrameRing, int] = {}
+        self._retired = set()
+        self._encode_lock = threading.Lock()
+        self._encoded: Optional[EncodedFrame] = None
+        # Set once the camera's own JPEGs are published; they are served as is
+        self._passthrough = False
+        self._jpeg_seq = 0
+        # Wakes threads and coroutines waiting for the next frame
+        self.signal = FrameSignal()
+        # Scaled / re-compressed JPEGs of the latest frame, by (scale, quality)
+        self._variants: 'OrderedDict[Tuple[float, int], EncodedFrame]' = OrderedDict()
+        self._variant_lock = threading.Lock()
+        self._decoded: Tuple[int, Optional[np.ndarray]] = (0, None)
+
+    @property
+    def seq(self) -> int:
+        # Under the lock so the ring cannot be replaced and closed mid-read
+        with self._lock:
+            ring = self.ring
+            return self._seq_base + (ring.seq if ring is not None else 0)
+
+    @property
+    def ring_name(self) -> Optional[str]:
+        """Shared memory name of the current ring, if frames are shared"""
+        ring = self.ring
+        return ring.name if ring is not None else None
+
+    def publish(self, frame: np.ndarray) -> int:
+        """
+        Copy a newly captured frame into the ring buffer (single capture thread)
+        Returns:
+            The frame's sequence number within the current ring (see ring_name)
+        """
+        ring = self.ring
+        if ring is None or ring.shape != frame.shape:
+            ring = self._reallocate(frame.shape)
+        seq = ring.write(frame)
+        self.signal.notify()
+        return seq
+
+    def publish_jpeg(self, data: bytes):
+        """Publish a JPEG received from the camera, to be served to viewers unchanged"""
+        with self._lock:
+            self._jpeg_seq += 1
+            self._passthrough = True
+            self._encoded = EncodedFrame(self._jpeg_seq, data, time.time())
+        self.signal.notify()
+
+    @property
+    def frame_seq(self) -> int:
+        """Sequence number of the latest frame viewers can get"""
+        return self._jpeg_seq if self._passthrough else self.seq
+
+    def wait_newer(self, seq: int, timeout: float) -> bool:
+        """Block until a frame newer than seq is published; returns False on timeout"""
+        return self.signal.wait(lambda: self.frame_seq != seq, timeout)
+
+    async def wait_newer_async(self, seq: int, timeout: float) -> bool:
+        """Await a frame newer than seq without blocking the event loop; returns False on timeout"""
+        return await self.signal.wait_async(lambda: self.frame_seq != seq, timeout)
+
+    def _reallocate(self, shape) -> FrameRing:
+        """(Re)create the ring for a new frame shape, keeping sequence numbers increasing"""
+        with self._lock:
+            old = self.ring
+            if old is not None:
+                self._seq_base += old.seq
+            self._generation += 1
+            name = f"{self.shared_name}_{self._generation}" if self.shared_name else None
+            self.ring = FrameRing(shape, slots=self.slots, name=name)
+            logger.info(f"Allocated {self.slots}-slot frame ring {shape} for camera {self.camera_id}")
+            if old is not None and self._readers.get(old):
+                # Still being read; the last reader closes it
+                self._retired.add(old)
+                old = None
+        if old is not None:
+            old.close(unlink=True)
+        return self.ring
+
+    @contextmanager
+    def _reading(self) -> Iterator[Tuple[Optional[FrameRing], int]]:
+        """Yield (ring, seq_base), keeping the ring open until the caller is done with it"""
+        with self._lock:
+            ring, base = self.ring, self._seq_base
+            if ring is not None:
+                self._readers[ring] = self._readers.get(ring, 0) + 1
+        try:
+            yield ring, base
+        finally:
+            if ring is not None:
+                with self._lock:
+                    remaining = self._readers.pop(ring) - 1
+                    if remaining:
+                        self._readers[ring] = remaining
+                    closing = not remaining and ring in self._retired
+                    if closing:
+                        self._retired.discard(ring)
+                if closing:
+                    ring.close(unlink=True)
+
+    def latest_frame(self) -> Tuple[int, Optional[np.ndarray]]:
+        """Return (seq, frame) of the latest frame without consuming it; the frame is a copy"""
+        seq, frame, _ = self._read()
+        return seq, frame
+
+    def _read(self) -> Tuple[int, Optional[np.ndarray], float]:
+        with self._reading() as (ring, base):
+            if ring is None:
+                return 0, None, 0.0
+            seq, frame, timestamp = ring.read_latest()
+        return (base + seq if frame is not None else 0), frame, timestamp
+
+    def stats(self) -> dict:
+        """Ring buffer counters for monitoring"""
+        with self._reading() as (ring, base):
+            if ring is None:
+                return {'seq': 0, 'written': 0, 'dropped': 0, 'slots': self.slots, 'shape': None,
+                        'passthrough': self._passthrough, 'jpeg_seq': self._jpeg_seq}
+            stats = ring.stats()
+            stats['seq'] = base + ring.seq
+        stats['passthrough'] = self._passthrough
+        if self._passthrough:
+            stats['jpeg_seq'] = self._jpeg_seq
+        return stats
+
+    def close(self):
+        """Release the ring buffer"""
+        with self._lock:
+            rings = [ring for ring in (self.ring, *self._retired) if ring is not None]
+            self.ring = None
+            # Rings still being read are closed by their last reader
+            self._retired = {ring for ring in rings if self._readers.get(ring)}
+            idle = [ring for ring in rings if ring not in self._retired]
+        for ring in idle:
+            ring.close(unlink=True)
+
+    def latest_jpeg(self) -> Optional[EncodedFrame]:
+        """Return the latest frame as JPEG, encoding it only if no viewer has yet"""
+        if self._passthrough:
+            return self._encoded
+        encoded = self._encoded
+        if encoded is not None and encoded.seq == self.seq:
+            return encoded
+
+        # Serialise encoding so concurrent viewers share one imencode per frame
+        with self._encode_lock:
+            if self._encoded is not None and self._encoded.seq == self.seq:
+                return self._encoded
+            seq, frame, timestamp = self._read()
+            if frame is None:
+                return None
+
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ret:
+                logger.error(f"Failed to encode frame {seq} from camera {self.camera_id}")
+                return None
+
+            encoded = EncodedFrame(seq, buffer.tobytes(), timestamp)
+            with self._lock:
+                if self._encoded is None or self._encoded.seq < seq:
+                    self._encoded = encoded
+            return encoded
+
+    def latest_variant(self, scale: float, quality: int) -> Optional[EncodedFrame]:
+        """
+        Return the latest frame scaled and encoded at the given JPEG quality
+        Each variant is encoded at most once per frame and shared by every viewer asking for it.
+        """
+        key = (scale, quality)
+        seq = self.frame_seq
+        encoded = self._variants.get(key)
+        if encoded is not None and encoded.seq == seq:
+            return encoded
+
+        with self._variant_lock:
+            encoded = self._variants.get(key)
+            if encoded is not None and encoded.seq == self.frame_seq:
+                self._variants.move_to_end(key)
+                return encoded
+            seq, frame, timestamp = self._source_frame()
+            if frame is None:
+                return None
+            if scale != 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ret:
+                logger.error(f"Failed to encode {scale}x/q{quality} frame {seq} from camera {self.camera_id}")
+                return None
+
+            encoded = EncodedFrame(seq, buffer.tobytes(), timestamp)
+            self._variants[key] = encoded
+            self._variants.move_to_end(key)
+            while len(self._variants) > MAX_VARIANTS:
+                self._variants.popitem(last=False)
+            return encoded
+
+    def _source_frame(self) -> Tuple[int, Optional[np.ndarray], float]:
+        """Latest frame as pixels; camera JPEGs are decoded at most once per frame for all variants"""
+        if not self._passthrough:
+            return self._read()
+        encoded = self._encoded
+        if encoded is None:
+            return 0, None, 0.0
+        seq, frame = self._decoded
+        if seq != encoded.seq:
+            frame = cv2.imdecode(np.frombuffer(encoded.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self._decoded = (encoded.seq, frame)
+        return encoded.seq, frame, encoded.timestamp
@@ -0,0 +1,145 @@
+import time
+import logging
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Header layout (int64): latest seq, frames written, frames dropped, last read seq,
+# slot count, then the frame shape (height, width, channels)
+_LATEST, _WRITTEN, _DROPPED, _LAST_READ, _SLOTS, _HEIGHT, _WIDTH, _CHANNELS = range(8)
+_HEADER_LEN = 8
+
+class FrameRing:
+    def __init__(self, shape: Tuple[int, ...], slots: int = 4, name: Optional[str] = None,
+                 create: bool = True):
+        """
+        Fixed-size ring of preallocated frames with lock-free latest-frame reads
+        Args:
+            shape: Frame shape, (height, width) or (height, width, channels)
+            slots: Number of frames kept; older frames are overwritten
+            name: Back the ring with multiprocessing.shared_memory under this name so other
+                processes can attach to it; None keeps it in private NumPy arrays
+            create: Create the shared memory block (False attaches to an existing one)
+        """
+        self.name = name
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+        if name is not None and not create:
+            self._shm = shared_memory.SharedMemory(name=name)
+            header = np.ndarray((_HEADER_LEN,), dtype=np.int64, buffer=self._shm.buf)
+            slots = int(header[_SLOTS])
+            shape = tuple(int(v) for v in header[_HEIGHT:_CHANNELS + 1] if v > 0)
+
+        shape = tuple(shape)
+        self.shape = shape
+        self.slots = slots
+        frame_bytes = int(np.prod(shape))
+        # Header, then per-slot seq and timestamp, then the frames
+        meta_len = _HEADER_LEN + 2 * slots
+        size = meta_len * 8 + slots * frame_bytes
+
+        if name is not None and create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        buffer = self._shm.buf if self._shm is not None else bytearray(size)
+
+        meta = np.ndarray((meta_len,), dtype=np.int64, buffer=buffer)
+        self._header = meta[:_HEADER_LEN]
+        self._slot_seq = meta[_HEADER_LEN:_HEADER_LEN + slots]
+        self._slot_time = meta[_HEADER_LEN + slots:]
+        self._frames = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=buffer, offset=meta_len * 8)
+
+        if create:
+            meta[:] = 0
+            self._header[_SLOTS] = slots
+            padded = (tuple(shape) + (0,))[:3]
+            self._header[_HEIGHT:_CHANNELS + 1] = padded
+
+    @classmethod
+    def attach(cls, name: str) -> 'FrameRing':
+        """Attach to a shared ring created by another process"""
+        return cls((), name=name, create=False)
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the latest frame (0 if none yet)"""
+        return int(self._header[_LATEST])
+
+    def write(self, frame: np.ndarray) -> int:
+        """Copy a frame into the next slot and return its sequence number (single writer)"""
+        seq = int(self._header[_LATEST]) + 1
+        slot = seq % self.slots
+        # Count the previous frame as dropped if no reader ever fetched it
+        if seq > 1 and self._header[_LAST_READ] < seq - 1:
+            self._header[_DROPPED] += 1
+        self._slot_seq[slot] = -1  # Mark the slot as being written
+        self._frames[slot] = frame
+        self._slot_time[slot] = time.time_ns()
+        self._slot_seq[slot] = seq
+        self._header[_LATEST] = seq
+        self._header[_WRITTEN] += 1
+        return seq
+
+    def read_latest(self, copy: bool = True) -> Tuple[int, Optional[np.ndarray], float]:
+        """
+        Read the latest frame without locking
+        Returns:
+            (seq, frame, timestamp); frame is None if nothing was written yet. With copy=False
+            the frame is a view that is overwritten `slots` writes later.
+        """
+        for _ in range(self.slots):
+            seq = int(self._header[_LATEST])
+            if seq == 0:
+                return 0, None, 0.0
+            slot = seq % self.slots
+            frame = self._frames[slot].copy() if copy else self._frames[slot]
+            timestamp = self._slot_time[slot] / 1e9
+            # Retry if the writer lapped us while copying
+            if self._slot_seq[slot] == seq:
+                if self._header[_LAST_READ] < seq:
+                    self._header[_LAST_READ] = seq
+                return seq, frame, timestamp
+        return 0, None, 0.0
+
+    def read(self, seq: int, copy: bool = True) -> Tuple[Optional[np.ndarray], float]:
+        """
+        Read the frame with the given sequence number without locking
+        Returns:
+            (frame, timestamp); frame is None if the frame was already overwritten
+        """
+        slot = seq % self.slots
+        if seq <= 0 or self._slot_seq[slot] != seq:
+            return None, 0.0
+        frame = self._frames[slot].copy() if copy else self._frames[slot]
+        timestamp = self._slot_time[slot] / 1e9
+        # The writer may have reused the slot while we copied
+        if self._slot_seq[slot] != seq:
+            return None, 0.0
+        if self._header[_LAST_READ] < seq:
+            self._header[_LAST_READ] = seq
+        return frame, timestamp
+
+    def stats(self) -> dict:
+        """Frame counters for monitoring"""
+        return {
+            'seq': int(self._header[_LATEST]),
+            'written': int(self._header[_WRITTEN]),
+            'dropped': int(self._header[_DROPPED]),
+            'slots': self.slots,
+            'shape': list(self.shape)
+        }
+
+    def close(self, unlink: bool = False):
+        """Release the shared memory block, destroying it if unlink is set (owner only)"""
+        if self._shm is None:
+            return
+        # Drop views into the buffer before closing it
+        self._header = self._slot_seq = self._slot_time = self._frames = None
+        self._shm.close()
+        if unlink:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shm = None
@@ -0,0 +1,191 @@
+import os
+import math
+import time
+import threading
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Share of all CPU cores that face detection may use, summed over every camera
+DETECTION_CPU_BUDGET = float(os.getenv("DETECTION_CPU_BUDGET", 0.5))
+# Seconds from frame capture to end of detection above which a camera is slowed down
+DETECTION_MAX_LATENCY = float(os.getenv("DETECTION_MAX_LATENCY", 1.0))
+# Bounds for the number of captured frames between two analyzed ones
+MIN_SKIP_FRAMES = int(os.getenv("MIN_SKIP_FRAMES", 1))
+MAX_SKIP_FRAMES = int(os.getenv("MAX_SKIP_FRAMES", 30))
+# Cadence of cameras without motion, only sampled to notice motion starting
+IDLE_SKIP_FRAMES = int(os.getenv("IDLE_SKIP_FRAMES", 5))
+# Longest time between analyzed frames of a camera, whatever the load; kept to half the
+# face tracker's TRACK_MAX_AGE so tracks survive a missed detection
+DETECTION_MAX_INTERVAL = float(os.getenv("DETECTION_MAX_INTERVAL", float(os.getenv("TRACK_MAX_AGE", 3)) / 2))
+
+class CameraCadence:
+    def __init__(self, skip: int):
+        """Measurements and chosen cadence of one camera"""
+        self.skip = skip
+        self.counter = 0
+        self.motion = False
+        self.fps = 0.0
+        self.latency = 0.0
+        self.busy = 0.0
+        self.penalty = 1.0
+        self.frames = 0
+        self.detections = 0
+        self.last_frame: Optional[float] = None
+        self.last_detection: Optional[float] = None
+
+class FrameScheduler:
+    def __init__(self, cpu_budget: float = DETECTION_CPU_BUDGET, max_latency: float = DETECTION_MAX_LATENCY,
+                 min_skip: int = MIN_SKIP_FRAMES, max_skip: int = MAX_SKIP_FRAMES,
+                 idle_skip: int = IDLE_SKIP_FRAMES, max_interval: float = DETECTION_MAX_INTERVAL,
+                 update_interval: float = 1.0, smoothing: float = 0.2):
+        """
+        Choose per camera how many captured frames to skip between analyzed ones
+        Cameras with motion share the detection CPU budget, divided by their measured
+        detection cost; cameras whose detections fall behind max_latency back off further.
+        Args:
+            cpu_budget: Fraction of all cores detection may use
+            max_latency: Seconds from capture to end of detection before a camera backs off
+            min_skip, max_skip: Bounds for the chosen cadence
+            idle_skip: Cadence of cameras without motion
+            max_interval: Longest time between analyzed frames, overriding the cadence
+            update_interval: Seconds between cadence recalculations
+            smoothing: Weight of each new measurement in the moving averages
+        """
+        self.cpu_budget = cpu_budget
+        self.max_latency = max_latency
+        self.min_skip = min_skip
+        self.max_skip = max_skip
+        self.idle_skip = idle_skip
+        self.max_interval = max_interval
+        self.update_interval = update_interval
+        self.smoothing = smoothing
+        self.cpu_count = os.cpu_count() or 1
+        self.cameras: Dict[int, CameraCadence] = {}
+        self.system_load = 0.0
+        self._last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _camera(self, camera_id: int) -> CameraCadence:
+        camera = self.cameras.get(camera_id)
+        if camera is None:
+            camera = self.cameras[camera_id] = CameraCadence(self.idle_skip)
+        return camera
+
+    def _average(self, current: float, value: float) -> float:
+        return value if current == 0 else current + self.smoothing * (value - current)
+
+    def tick(self, camera_id: int) -> bool:
+        """Count a captured frame; returns True when it is due for analysis"""
+        now = time.monotonic()
+        with self._lock:
+            camera = self._camera(camera_id)
+            if camera.last_frame is not None and now > camera.last_frame:
+                camera.fps = self._average(camera.fps, 1.0 / (now - camera.last_frame))
+            camera.last_frame = now
+            camera.frames += 1
+            camera.counter += 1
+            due = camera.counter >= camera.skip
+            if due:
+                camera.counter = 0
+            if now - self._last_update >= self.update_interval:
+                self._last_update = now
+                self._rebalance()
+        return due
+
+    def set_motion(self, camera_id: int, active: bool):
+        """Record whether the last analyzed frame of a camera showed motion"""
+        with self._lock:
+            camera = self._camera(camera_id)
+            if active != camera.motion:
+                camera.motion = active
+                # React to motion starting or ending without waiting for the next update
+                self._rebalance()
+
+    def remove(self, camera_id: int):
+        """Forget a camera that stopped, so it no longer takes a share of the budget"""
+        with self._lock:
+            if self.cameras.pop(camera_id, None) is not None:
+                self._rebalance()
+
+    def record_detection(self, camera_id: int, latency: float, busy: float):
+        """
+        Record one detection
+        Args:
+            latency: Seconds from frame capture to end of detection, queueing included
+            busy: Seconds spent detecting
+        """
+        with self._lock:
+            camera = self._camera(camera_id)
+            camera.latency = self._average(camera.latency, latency)
+            camera.busy = self._average(camera.busy, busy)
+            camera.detections += 1
+            camera.last_detection = time.monotonic()
+
+    def _rebalance(self):
+        """Recalculate every camera's cadence; called with the lock held"""
+        try:
+            self.system_load = os.getloadavg()[0] / self.cpu_count
+        except (AttributeError, OSError):
+            self.system_load = 0.0
+        # Leave room for whatever else is loading the machine
+        budget = self.cpu_budget * self.cpu_count
+        if self.system_load > 1.0:
+            budget /= self.system_load
+
+        now = time.monotonic()
+        stale_after = 2 * max(self.max_latency, self.update_interval)
+        active = [camera for camera in self.cameras.values() if camera.motion]
+        for camera in self.cameras.values():
+            if camera.last_detection is None or now - camera.last_detection > stale_after:
+                # No recent detections to judge latency by (e.g. motion ended): recover, and
+                # start the average afresh with the next detection
+                camera.latency = 0.0
+                camera.penalty = max(1.0, camera.penalty / 2)
+            elif camera.latency > self.max_latency:
+                camera.penalty = min(8.0, camera.penalty * 2)
+            elif camera.latency < self.max_latency / 2:
+                camera.penalty = max(1.0, camera.penalty / 2)
+
+            if not camera.motion:
+                # Idle cameras cost little; the penalty only slows cameras with motion
+                skip = self.idle_skip
+            elif camera.busy > 0 and camera.fps > 0:
+                # Detections per second this camera can afford within its share of the budget
+                rate = budget / len(active) / camera.busy
+                skip = math.ceil(camera.fps / rate * camera.penalty)
+            else:
+                skip = math.ceil(self.min_skip * camera.penalty)
+            max_skip = self.max_skip
+            if camera.fps > 0:
+                # Never let tracks expire, or short events slip, between analyzed frames
+                max_skip = min(max_skip, max(1, int(self.max_interval * camera.fps)))
+            camera.skip = max(self.min_skip, min(max_skip, skip))
+
+    def stats(self) -> Dict:
+        """Chosen cadence and the measurements behind it"""
+        with self._lock:
+            return {
+                'cpu_budget': self.cpu_budget,
+                'max_latency': self.max_latency,
+                'max_interval': self.max_interval,
+                'system_load': round(self.system_load, 3),
+                'cameras': {
+                    camera_id: {
+                        'skip_frames': camera.skip,
+                        'motion': camera.motion,
+                        'capture_fps': round(camera.fps, 2),
+                        'detect_fps': round(camera.fps / camera.skip, 2),
+                        'detect_seconds': round(camera.busy, 4),
+                        'latency_seconds': round(camera.latency, 4),
+                        'latency_penalty': camera.penalty,
+                        'frames': camera.frames,
+                        'detections': camera.detections
+                    }
+                    for camera_id, camera in self.cameras.items()
+                }
+            }
+
+# Shared by every capture loop and the /cadence endpoint
+scheduler = FrameScheduler()
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from typing import Callable
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class FrameSignal:
+    def __init__(self):
+        """
+        Wake consumers exactly when a new frame is published
+        Threads block on a condition variable; coroutines await a future resolved on
+        their own event loop, so neither polls while waiting.
+        """
+        self._condition = threading.Condition()
+        self._async_waiters = set()
+
+    def notify(self):
+        """Wake every waiting thread and coroutine (publisher side)"""
+        with self._condition:
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # The waiter's loop has been closed
+
+    def wait(self, ready: Callable[[], bool], timeout: float) -> bool:
+        """Block until ready() is true or timeout seconds pass; returns ready()"""
+        with self._condition:
+            return self._condition.wait_for(ready, timeout)
+
+    async def wait_async(self, ready: Callable[[], bool], timeout: float) -> bool:
+        """Await, without blocking the event loop, until ready() is true or timeout seconds pass"""
+        if ready():
+            return True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            future = loop.create_future()
+            waiter = (loop, future)
+            with self._condition:
+                # Checked under the lock so a notify cannot slip in before registration
+                if ready():
+                    return True
+                self._async_waiters.add(waiter)
+            remaining = deadline - loop.time()
+            try:
+                await asyncio.wait_for(future, max(0.0, remaining))
+            except asyncio.TimeoutError:
+                return ready()
+            finally:
+                with self._condition:
+                    self._async_waiters.discard(waiter)
+            if ready():
+                return True
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from src.sensor_stream import parse_sensor_values
+from src.shared_state import update_device_health
+
+logger = logging.getLogger(__name__)
+
+class IOHub:
+    def __init__(self, poll_interval: float = 0.1, connect_timeout: float = 3.0,
+                 read_timeout: float = 30.0, max_backoff: float = 30.0):
+        """
+        One asyncio event loop, on one thread, for all sensor streams and device probes
+        Args:
+            poll_interval: Delay between requests to sensors that answer one value per request
+            connect_timeout: Timeout for TCP connects, including liveness probes
+            read_timeout: Seconds without data before a sensor stream is considered dead
+            max_backoff: Upper bound for the sensor reconnect delay
+        """
+        self.poll_interval = poll_interval
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_backoff = max_backoff
+        self.loop = asyncio.new_event_loop()
+        self.thread: Optional[threading.Thread] = None
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self):
+        """Start the event loop thread"""
+        self.thread = threading.Thread(target=self._run_loop, name="io-hub", daemon=True)
+        self.thread.start()
+        logger.info("I/O hub started")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    def stop(self, timeout: float = 5):
+        """Cancel all tasks and stop the event loop"""
+        if self.thread is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self.loop).result(timeout)
+        except Exception as e:
+            logger.error(f"Error cancelling I/O hub tasks: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=timeout)
+        self.thread = None
+        logger.info("I/O hub stopped")
+
+    async def _cancel_tasks(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    def _spawn(self, key: str, coro):
+        """Schedule a long-running coroutine on the loop from any thread"""
+        def create():
+            previous = self.tasks.get(key)
+            if previous is not None:
+                previous.cancel()
+            self.tasks[key] = self.loop.create_task(coro)
+        self.loop.call_soon_threadsafe(create)
+
+    def add_sensor(self, sensor: dict, on_value: Callable[[str], None]):
+        """
+        Follow a sensor's /stream endpoint; on_value is called on the hub thread for each
+        value as soon as it is parsed, so it must be quick and thread-safe
+        """
+        self._spawn(f"sensor:{sensor['mac']}", self._follow_sensor(sensor, on_value))
+
+    def watch_device(self, device: dict, port: int, interval: float = 10.0):
+        """Probe a device's TCP port every `interval` seconds and record its health"""
+        self._spawn(f"watch:{device['mac']}", self._watch_device(device, port, interval))
+
+    def unwatch_device(self, device: dict):
+        """Stop probing a device started with watch_device"""
+        def cancel():
+            task = self.tasks.pop(f"watch:{device['mac']}", None)
+            if task is not None:
+                task.cancel()
+        self.loop.call_soon_threadsafe(cancel)
+
+    def check_alive(self, targets: List[Tuple[str, int]], timeout: Optional[float] = None) -> List[bool]:
+        """Probe several (host, port) targets concurrently; blocking call for other threads"""
+        timeout = self.connect_timeout if timeout is None else timeout
+        future = asyncio.run_coroutine_threadsafe(self.probe_all(targets, timeout), self.loop)
+        return future.result(timeout + 5)
+
+    async def probe_all(self, targets: List[Tuple[str, int]], timeout: float) -> List[bool]:
+        """Probe several (host, port) targets concurrently"""
+        return list(await asyncio.gather(*(self.probe(host, port, timeout) for host, port in targets)))
+
+    async def probe(self, host: str, port: int, timeout: float) -> bool:
+        """Check whether a TCP connection can be opened"""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            writer.close()
+            return True
+        except Exception:
+            return False
+
+    async def _watch_device(self, device: dict, port: int, interval: float):
+        while True:
+            alive = await self.probe(device['ip'], port, self.connect_timeout)
+            update_device_health(device['mac'], name=device['name'], alive=alive)
+            await asyncio.sleep(interval)
+
+    async def _follow_sensor(self, sensor: dict, on_value: Callable[[str], None]):
+        host, port = sensor['ip'], sensor.get('port', 81)
+        backoff = 0.5
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.connect_timeout)
+                update_device_health(sensor['mac'], name=sensor['name'], alive=True)
+                backoff = 0.5
+                if not await self._read_responses(reader, writer, host, sensor, on_value):
+                    # The sensor closed the connection cleanly; reconnect after a short pause
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                update_device_health(sensor['mac'], name=sensor['name'], alive=False, error=str(e))
+                logger.warning(f"Sensor {sensor['name']} ({sensor['mac']}) stream error: {e!r}; "
+                               f"reconnecting in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    async def _read_responses(self, reader, writer, host: str, sensor: dict, on_value) -> bool:
+        """
+        Issue GET /stream requests on one connection until the server ends it
+        Returns:
+            True if the server closed the connection between polls, so the next poll is due right away
+        """
+        reused = False
+        while True:
+            try:
+                writer.write(f"GET /stream HTTP/1.1\r\nHost: {host}\r\n"
+                             f"Accept: text/event-stream, text/plain\r\nConnection: keep-alive\r\n\r\n".encode())
+                await writer.drain()
+                response = await self._read_headers(reader, eof_ok=reused)
+            except (ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                response = None
+            if response is None:
+                # Many ESP sensors close the socket after each response without saying
+                # Connection: close; that is a normal end of the connection, not an error
+                return True
+            status, headers = response
+            if status != 200:
+                raise ConnectionError(f"HTTP {status}")
+
+            if 'content-length' in headers:
+                # One value per response: keep polling over the same connection
+                body = await self._timed(reader.readexactly(int(headers['content-length'])))
+                value = body.decode('utf-8', errors='ignore').strip()
+                if value:
+                    on_value(value)
+                if headers.get('connection', '').lower() == 'close':
+                    return False
+                reused = True
+                await asyncio.sleep(self.poll_interval)
+            elif headers.get('transfer-encoding', '').lower() == 'chunked':
+                await self._read_chunked(reader, on_value)
+                return False
+            else:
+                await self._read_until_eof(reader, on_value)
+                return False
+
+    async def _timed(self, awaitable):
+        return await asyncio.wait_for(awaitable, self.read_timeout)
+
+    async def _read_headers(self, reader, eof_ok: bool = False) -> Optional[Tuple[int, Dict[str, str]]]:
+        """Read a status line and headers; returns None if eof_ok and the connection ended first"""
+        status_line = (await self._timed(reader.readline())).decode('latin-1').strip()
+        if not status_line:
+            if eof_ok:
+                return None
+            raise ConnectionError("Connection closed by sensor")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self._timed(reader.readline())).decode('latin-1').strip()
+            if not line:
+                return status, headers
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _read_chunked(self, reader, on_value):
+        buffer = ''
+        while True:
+            size_line = (await self._timed(reader.readline())).decode('latin-1').strip()
+            if not size_line:
+                raise ConnectionError("Chunked stream ended unexpectedly")
+            size = int(size_line.split(';')[0], 16)
+            if size == 0:
+                # Skip trailers
+                while (await self._timed(reader.readline())).strip():
+                    pass
+                break
+            chunk = await self._timed(reader.readexactly(size))
+            await self._timed(reader.readexactly(2))  # CRLF after each chunk
+            buffer = self._emit(buffer + chunk.decode('utf-8', errors='ignore'), on_value)
+        self._emit(buffer + '\n', on_value)
+
+    async def _read_until_eof(self, reader, on_value):
+        buffer = ''
+        while True:
+            data = await self._timed(reader.read(1024))
+            if not data:
+                break
+            buffer = self._emit(buffer + data.decode('utf-8', errors='ignore'), on_value)
+        self._emit(buffer + '\n', on_value)
+
+    @staticmethod
+    def _emit(buffer: str, on_value) -> str:
+        values, remainder = parse_sensor_values(buffer.replace('\r', ''))
+        for value in values:
+            on_value(value)
+        return remainder
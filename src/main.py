@@ -1,29 +1,148 @@
 import os
 import cv2
 import json
-from datetime import datetime
+import numpy as np
 import threading
 import time
-import requests
-from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from src.network_scanner import get_network_devices
-from src.shared_state import camera_streams, camera_caps, sensor_addresses, sensor_data, stop_event, put_frame, update_sensor_data
-from src.firebase_service import init_firebase, upload_image_data, get_firebase_app
+from src.shared_state import camera_streams, camera_caps, camera_pipelines, clip_recorders, sensor_addresses, stop_event, put_frame, update_sensor_data, is_motion_active, set_sensor_zone, get_broadcaster, enable_shared_frames, close_broadcasters, put_jpeg
+from src.firebase_service import init_firebase, upload_image_group, get_firebase_app
 from src.discovery_service import DiscoveryService
 from src.face_service import FaceService
-
-# Initialize Firebase and get app instance
-firebase_app = init_firebase()
+from src.pipeline import Pipeline, PipelineStage, DROP_OLDEST, NEVER_DROP
+from src.upload_service import UploadService
+from src.camera_analyzer import CameraAnalyzer, event_timestamp
+from src.detection_worker import DetectionWorkerPool, default_worker_count
+from src.sensor_stream import SensorStreamClient
+from src.io_hub import IOHub
+from src.mjpeg_stream import MJPEGStream
+from src.clip_recorder import ClipRecorder, clip_writer, CLIP_BUFFER_MB
+from src.motion_gate import MotionGate
+from src.frame_scheduler import scheduler
+from src.camera_supervisor import CameraSupervisor
 
 directories_to_create = ["faces", "secrets"]
 for directory in directories_to_create:
     os.makedirs(directory, exist_ok=True)
 
-def get_sensor_trigger_status():
-    """Check if motion is detected"""
-    return sensor_data.get('motion_detected', False)
+# Queue sizes and drop policies between capture, detection and recognition.
+# Live frames are dropped oldest-first before detection; frames with detected faces
+# are evidence and are never dropped: a slow recognizer holds up detection instead
+# (whose own queue keeps capture running), and uploads go to the upload service,
+# which spools to disk when it falls behind.
+DETECT_QUEUE_SIZE = int(os.getenv("DETECT_QUEUE_SIZE", 2))
+DETECT_DROP_POLICY = os.getenv("DETECT_DROP_POLICY", DROP_OLDEST)
+RECOGNIZE_QUEUE_SIZE = int(os.getenv("RECOGNIZE_QUEUE_SIZE", 4))
+RECOGNIZE_DROP_POLICY = os.getenv("RECOGNIZE_DROP_POLICY", NEVER_DROP)
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", 32))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 2))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", 0))  # 0 retries forever
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "spool") or None  # Empty disables spool-on-failure
+
+# "thread" runs detection in per-camera thread pipelines; "process" runs it in
+# DETECTION_WORKERS processes (default: one per camera, capped at CPU cores)
+# that read frames from shared memory
+DETECTION_MODE = os.getenv("DETECTION_MODE", "thread")
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", 0))
+
+# "any" (default) scans the whole frame while a sensor covering the camera reports
+# motion, and otherwise only the region that changed between frames; "pixel" ignores
+# the sensors; "both" requires sensor and pixel motion; "sensor" ignores pixel motion
+MOTION_GATING = os.getenv("MOTION_GATING", "any")
+
+# "passthrough" forwards the cameras' MJPEG bytes to viewers and only decodes frames
+# due for detection; "opencv" decodes every frame with cv2.VideoCapture
+CAPTURE_MODE = os.getenv("CAPTURE_MODE", "passthrough")
+
+# Seconds between attempts to reopen a dead camera stream, doubling up to the maximum,
+# and consecutive failed reads after which a stream is considered dead
+CAPTURE_RETRY_MIN = float(os.getenv("CAPTURE_RETRY_MIN", 1))
+CAPTURE_RETRY_MAX = float(os.getenv("CAPTURE_RETRY_MAX", 30))
+CAPTURE_MAX_READ_FAILURES = int(os.getenv("CAPTURE_MAX_READ_FAILURES", 3))
+
+# Keep pre/post-event clips of motion and unknown faces (see src/clip_recorder.py)
+CLIP_RECORDING = os.getenv("CLIP_RECORDING", "true").lower() in ("1", "true", "yes")
+
+# "asyncio" follows all sensors on the I/O hub's single event loop; "thread"
+# runs one SensorStreamClient thread per sensor
+SENSOR_IO_MODE = os.getenv("SENSOR_IO_MODE", "asyncio")
+
+def handle_upload_job(job: dict) -> bool:
+    """Run one upload job from the upload service"""
+    return upload_image_group(
+        job['camera_id'],
+        job['image_type'],
+        job['images'],
+        job['timestamp'],
+        job['print_message'],
+        notify_key=job.get('notify_key'),
+        notify=job.get('notify', True)
+    )
+
+upload_service = UploadService(
+    handle_upload_job,
+    spool_dir=UPLOAD_SPOOL_DIR,
+    queue_size=UPLOAD_QUEUE_SIZE,
+    concurrency=UPLOAD_WORKERS,
+    max_attempts=UPLOAD_MAX_ATTEMPTS
+)
+
+def get_sensor_trigger_status(camera_mac: str = None):
+    """Check if motion is detected in the zone covered by a camera"""
+    return is_motion_active(camera_mac)
 
-def process_camera(camera: dict, camera_id: int, stop_event: threading.Event, face_service: FaceService):
+def should_detect(camera: dict, roi) -> Tuple[bool, Optional[Tuple[int, int, int, int]]]:
+    """
+    Decide from sensor and pixel motion whether a sampled frame goes to detection
+    Returns:
+        (detect, roi): roi is the region to scan, None for the whole frame
+    """
+    if MOTION_GATING == "sensor":
+        return get_sensor_trigger_status(camera.get('mac')), None
+    if MOTION_GATING == "both":
+        return roi is not None and get_sensor_trigger_status(camera.get('mac')), roi
+    if MOTION_GATING != "pixel" and get_sensor_trigger_status(camera.get('mac')):
+        # The sensor saw something the pixel gate may have missed; scan the whole frame
+        return True, None
+    return roi is not None, roi
+
+def handle_detection_job(job: dict):
+    """Upload the new tracks of a frame as one event in the background, and keep a clip of unknown faces"""
+    recorder = clip_recorders.get(job['camera_id'])
+    if recorder is not None and any(image['unknown'] for image in job['images']):
+        recorder.trigger('unknown_face')
+    upload_service.submit(job)
+
+def build_camera_pipeline(camera_id: int, face_service: FaceService) -> Pipeline:
+    """Build the detect -> recognize pipeline fed by a camera's capture loop"""
+    analyzer = CameraAnalyzer(camera_id, face_service)
+
+    def detect(item):
+        frame, roi, captured_at = item
+        started = time.time()
+        faces = analyzer.detect(frame, roi)
+        finished = time.time()
+        scheduler.record_detection(camera_id, finished - captured_at, finished - started)
+        if len(faces) > 0:
+            return [(frame, faces, event_timestamp())]
+        return None
+
+    def recognize(item):
+        job = analyzer.recognize(*item)
+        if job:
+            handle_detection_job(job)
+        return None
+
+    return Pipeline([
+        PipelineStage(f"camera{camera_id}-detect", detect,
+                      maxsize=DETECT_QUEUE_SIZE, drop_policy=DETECT_DROP_POLICY),
+        PipelineStage(f"camera{camera_id}-recognize", recognize,
+                      maxsize=RECOGNIZE_QUEUE_SIZE, drop_policy=RECOGNIZE_DROP_POLICY),
+    ])
+
+def process_camera(camera: dict, camera_id: int, stop_event: threading.Event, face_service: FaceService,
+                   detection_pool: DetectionWorkerPool = None):
     print(f"Processing camera {camera_id} with info: {json.dumps(camera, indent=2)}")
     camera_streams[camera_id] = camera
     
@@ -36,136 +155,226 @@ def process_camera(camera: dict, camera_id: int, stop_event: threading.Event, fa
         print(f"Available keys: {list(camera.keys())}")
         return
 
-    cap = cv2.VideoCapture(camera_url)
-    if not cap.isOpened():
-        print(f"Error: Could not open video stream from camera {camera_id} at URL: {camera_url}")
-        return
+    motion_gate = MotionGate() if MOTION_GATING != "sensor" else None
 
-    print(f"Successfully opened camera {camera_id} stream")
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
-    cap.set(cv2.CAP_PROP_FPS, 5)
+    # Detection, recognition and uploads run on their own workers (threads, or
+    # processes when a detection pool is given) so the capture loop never waits on them
+    pipeline = None
+    if detection_pool is None:
+        pipeline = build_camera_pipeline(camera_id, face_service)
+        camera_pipelines[camera_id] = pipeline
+        pipeline.start()
+    broadcaster = get_broadcaster(camera_id)
 
-    frame_count = 0
-    skip_frames = 5
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    recorder = None
+    if CLIP_RECORDING:
+        buffer_mb = camera.get('clip_buffer_mb') or CLIP_BUFFER_MB
+        recorder = ClipRecorder(camera_id, clip_writer, max_bytes=int(buffer_mb * 1024 * 1024))
+        clip_recorders[camera_id] = recorder
 
+    cap = None
+    read_failures = 0
+    backoff = CAPTURE_RETRY_MIN
     while not stop_event.is_set():
-        ret, frame = cap.read()
+        if cap is None:
+            cap = MJPEGStream(camera_url) if CAPTURE_MODE == "passthrough" else cv2.VideoCapture(camera_url)
+            if not cap.isOpened():
+                print(f"Error: Could not open video stream from camera {camera_id} at URL: {camera_url}; "
+                      f"retrying in {backoff:.0f}s")
+                cap.release()
+                cap = None
+                stop_event.wait(backoff)
+                backoff = min(CAPTURE_RETRY_MAX, backoff * 2)
+                continue
+
+            print(f"Successfully opened camera {camera_id} stream")
+            if motion_gate is not None:
+                # The scene may have changed while the stream was down
+                motion_gate.reset()
+            if CAPTURE_MODE != "passthrough":
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
+                cap.set(cv2.CAP_PROP_FPS, 5)
+            read_failures = 0
+
+        ret, data = cap.read()
         if not ret:
+            read_failures += 1
             print(f"Failed to grab frame from camera {camera_id}")
-            time.sleep(1)
+            if read_failures >= CAPTURE_MAX_READ_FAILURES or not cap.isOpened():
+                # The stream is dead; reopen it after the backoff delay
+                cap.release()
+                cap = None
+                stop_event.wait(backoff)
+                backoff = min(CAPTURE_RETRY_MAX, backoff * 2)
+            else:
+                stop_event.wait(1)
             continue
+        read_failures = 0
+        backoff = CAPTURE_RETRY_MIN
+
+        if CAPTURE_MODE == "passthrough":
+            # Viewers get the camera's own JPEG; frames are only decoded for detection
+            put_jpeg(camera_id, data)
+            frame = None
+            ring_seq = 0
+        else:
+            # Always publish frame to the ring buffer for live viewing
+            frame = data
+            ring_seq = put_frame(camera_id, frame)
+
+        if recorder is not None:
+            # The camera's own JPEG in passthrough mode; decoded frames are only encoded
+            # if they end up in a clip, so recording does not defeat lazy encoding
+            recorder.add(data)
 
-        # Always put frame in queue for live viewing
-        put_frame(camera_id, frame)
-
-        # Only process if motion detected
-        if get_sensor_trigger_status():
-            frame_count += 1
-            if frame_count % skip_frames == 0:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-                
-                if len(faces) > 0:
-                    timestamp = int(datetime.now().strftime("%Y%m%d%H%M%S"))
-                    for (x, y, w, h) in faces:
-                        face = frame[y:y+h, x:x+w]
-                        face_image_name = f"camera_{camera_id}_time_{timestamp}.jpg"
-                        face_image_path = f"faces/{face_image_name}"
-                        cv2.imwrite(face_image_path, face)
-                        
-                        # Check if face is unknown
-                        is_unknown = face_service.is_face_unknown(face)
-                        
-                        # Upload image with notification if unknown
-                        upload_image_data(
-                            camera_id, 
-                            "face", 
-                            face_image_path, 
-                            face_image_name, 
-                            timestamp, 
-                            f"Camera {camera_id} - {'Unknown' if is_unknown else ''} Face Detected - ",
-                            notify=is_unknown
-                        )
-        
-        time.sleep(0.01)  # Small delay to prevent CPU overload
-
-    cap.release()
+        # The scheduler picks how many frames to skip from load, detection latency and motion
+        if scheduler.tick(camera_id):
+            if frame is None:
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    print(f"Failed to decode frame from camera {camera_id}")
+                    continue
+                if detection_pool is not None:
+                    # Detection worker processes read the decoded frame from the ring buffer;
+                    # thread pipelines get it directly and viewers get the camera's JPEG
+                    ring_seq = put_frame(camera_id, frame)
+            # Pixel motion gives the region worth scanning; in "sensor" gating mode there is
+            # none and the whole frame is scanned
+            roi = motion_gate.update(frame) if motion_gate is not None else None
+            detect, roi = should_detect(camera, roi)
+            scheduler.set_motion(camera_id, detect)
+            if detect:
+                if recorder is not None:
+                    recorder.trigger('motion')
+                if pipeline is not None:
+                    pipeline.put((frame, roi, time.time()))
+                else:
+                    detection_pool.submit(camera_id, broadcaster.ring_name, ring_seq, event_timestamp(), roi)
+
+    # A worker that outlived its stop timeout must not remove the entries of the
+    # worker restarted in its place, which shares the camera ID
+    if pipeline is not None:
+        pipeline.stop()
+        if camera_pipelines.get(camera_id) is pipeline:
+            camera_pipelines.pop(camera_id, None)
+    if recorder is not None:
+        # Finish the clip being recorded rather than lose the event
+        recorder.close()
+        if clip_recorders.get(camera_id) is recorder:
+            clip_recorders.pop(camera_id, None)
+    if cap is not None:
+        cap.release()
+    if camera_streams.get(camera_id) is camera:
+        camera_streams.pop(camera_id, None)
+        scheduler.remove(camera_id)
     print(f"Camera {camera_id} released.")
 
+def sensor_value_handler(sensor: dict):
+    """Build the callback applying a sensor's values to the shared motion state"""
+    def on_value(value):
+        if update_sensor_data(value, sensor['mac']):
+            print(f"Motion detection state changed: {value} from sensor {sensor['name']} ({sensor['mac']})")
+    return on_value
+
 def monitor_sensor(sensor: dict, stop_event: threading.Event):
-    """Monitor sensor stream"""
-    while not stop_event.is_set():
-        try:
-            response = requests.get(f"http://{sensor['ip']}:81/stream")
-            if response.status_code == 200:
-                if update_sensor_data(response.text):
-                    print(f"Motion detection state changed: {response.text} from sensor {sensor['name']} ({sensor['mac']})")
-        except Exception as e:
-            print(f"Error reading from sensor {sensor['name']} ({sensor['mac']}): {str(e)}")
-        time.sleep(0.1)
+    """Monitor sensor stream on a dedicated thread, applying each value as soon as it arrives"""
+    SensorStreamClient(sensor, sensor_value_handler(sensor), stop_event).run()
 
 def main():
+    # Initialize Firebase here rather than at import time, since detection worker
+    # processes re-import this module
+    init_firebase()
+
     # Initialize face service with Firebase app
     face_service = FaceService(get_firebase_app())
     global stop_event
     stop_event = threading.Event()
 
+    upload_service.start()
+    if CLIP_RECORDING:
+        clip_writer.start()
+
+    # Sensor streams and device liveness probes share one event loop thread
+    io_hub = IOHub()
+    io_hub.start()
+
+    # Capture is I/O bound, so one thread per camera, started and stopped as cameras come and go
+    supervisor = CameraSupervisor(
+        lambda camera, camera_id, camera_stop: process_camera(camera, camera_id, camera_stop,
+                                                              face_service, detection_pool),
+        on_start=lambda camera: io_hub.watch_device(camera, camera['port']),
+        on_stop=io_hub.unwatch_device
+    )
+
+    detection_pool = None
+    if DETECTION_MODE == "process":
+        # Frames must live in shared memory for the worker processes to read them
+        enable_shared_frames()
+        detection_pool = DetectionWorkerPool(
+            DETECTION_WORKERS or default_worker_count(len(supervisor.camera_ids)),
+            handle_detection_job,
+            timing_handler=scheduler.record_detection
+        )
+        detection_pool.start()
+
     print("Initializing discovery service...")
-    discovery_service = DiscoveryService()
+    discovery_service = DiscoveryService(io_hub=io_hub)
+    discovery_service.subscribe(supervisor.handle_event)
     print("Starting discovery service...")
     discovery_service.start()
 
-    print("Getting device information using MAC addresses...")
-    devices = get_network_devices()
+    try:
+        print("Getting device information using MAC addresses...")
+        devices = get_network_devices(on_reconcile=supervisor.reconcile)
 
-    # Initialize cameras
-    cameras = devices['cameras']
-    print(f"\nFound cameras: {json.dumps(cameras, indent=2)}")
-    
-    if len(cameras) < 1:  # Changed from 2 to 1 since we have one ESP32CAM
-        print(f"Error: No cameras found.")
-        return
+        # Initialize cameras
+        cameras = devices['cameras']
+        print(f"\nFound cameras: {json.dumps(cameras, indent=2)}")
+        if not cameras:
+            print("Warning: No cameras found yet; they will be started when discovered.")
+        for camera in cameras:
+            supervisor.start_camera(camera)
+        print("All cameras started.")
 
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        try:
-            futures = [executor.submit(process_camera, camera, i, stop_event, face_service) 
-                      for i, camera in enumerate(cameras, 1)]
-            print("All cameras started.")
-            
-            # Initialize sensor addresses
-            sensors = devices['sensors']
-            if not sensors:
-                print("Warning: No ultrasonic sensors found.")
-            else:
-                # Start sensor monitoring threads
-                sensor_threads = []
-                for sensor in sensors:
+        # Initialize sensor addresses
+        sensors = devices['sensors']
+        if not sensors:
+            print("Warning: No ultrasonic sensors found.")
+        else:
+            sensor_threads = []
+            for sensor in sensors:
+                set_sensor_zone(sensor['mac'], sensor.get('cameras'))
+                if SENSOR_IO_MODE == "asyncio":
+                    io_hub.add_sensor(sensor, sensor_value_handler(sensor))
+                else:
                     thread = threading.Thread(target=monitor_sensor, args=(sensor, stop_event))
                     thread.start()
                     sensor_threads.append(thread)
-                    print(f"Started monitoring sensor: {sensor['name']} at {sensor['ip']}")
-            
-            while True:
-                time.sleep(0.1)
-                
-        except KeyboardInterrupt:
-            print("\nProgram interrupted by user. Shutting down...")
-            stop_event.set()
-            
-            for future in futures:
-                try:
-                    future.result(timeout=10)
-                except Exception as e:
-                    print(f"Error waiting for thread: {e}")
-            
-            print("All cameras released. Exiting...")
-        finally:
-            discovery_service.stop()
-            print("Discovery service stopped.")
-            executor.shutdown(wait=True)
-            print("Executor shut down.")
+                print(f"Started monitoring sensor: {sensor['name']} at {sensor['ip']}")
+
+        while True:
+            time.sleep(0.1)
+
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user. Shutting down...")
+        stop_event.set()
+    finally:
+        supervisor.stop_all()
+        print("All cameras released.")
+        discovery_service.stop()
+        print("Discovery service stopped.")
+        io_hub.stop()
+        print("I/O hub stopped.")
+        if detection_pool is not None:
+            detection_pool.stop()
+            print("Detection workers stopped.")
+        upload_service.stop()
+        print("Upload service stopped.")
+        if CLIP_RECORDING:
+            clip_writer.stop()
+            print("Clip writer stopped.")
+        close_broadcasters()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,124 @@
+import logging
+import http.client
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+class MJPEGStream:
+    def __init__(self, url: str, timeout: float = 10.0, max_frame_size: int = 2 * 1024 * 1024):
+        """
+        Read the JPEG parts of a multipart/x-mixed-replace (MJPEG) HTTP stream as raw bytes
+        Mirrors the cv2.VideoCapture calls the capture loop makes (isOpened, read, release),
+        but read() returns the camera's original JPEG bytes instead of a decoded frame.
+        Args:
+            timeout: Connect timeout, and seconds without data before a read fails
+            max_frame_size: Parts larger than this are treated as a corrupt stream
+        """
+        self.url = url
+        self.max_frame_size = max_frame_size
+        self.boundary: Optional[bytes] = None
+        self._boundary_consumed = False
+        self.connection: Optional[http.client.HTTPConnection] = None
+        self.response: Optional[http.client.HTTPResponse] = None
+
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+            self.connection.request('GET', path, headers={'Accept': 'multipart/x-mixed-replace, image/jpeg'})
+            response = self.connection.getresponse()
+            content_type = response.getheader('Content-Type', '')
+            if response.status != 200 or not content_type.startswith('multipart/'):
+                raise ConnectionError(f"HTTP {response.status} {content_type!r}")
+            self.boundary = self._parse_boundary(content_type)
+            self.response = response
+        except Exception as e:
+            logger.warning(f"Could not open MJPEG stream {url}: {e}")
+            self.release()
+
+    @staticmethod
+    def _parse_boundary(content_type: str) -> Optional[bytes]:
+        for param in content_type.split(';')[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'boundary':
+                value = value.strip('"')
+                # Some servers include the leading dashes in the parameter
+                return value[2:].encode() if value.startswith('--') else value.encode()
+        return None
+
+    def isOpened(self) -> bool:
+        return self.response is not None
+
+    def read(self) -> Tuple[bool, Optional[bytes]]:
+        """Return (True, jpeg_bytes) for the next part, or (False, None) if the stream failed"""
+        if self.response is None:
+            return False, None
+        try:
+            headers = self._read_part_headers()
+            length = headers.get('content-length')
+            if length is not None:
+                size = int(length)
+                if size > self.max_frame_size:
+                    raise ValueError(f"Part of {size} bytes exceeds {self.max_frame_size}")
+                data = self._read_exactly(size)
+            else:
+                data = self._read_until_boundary()
+            if not data.startswith(b'\xff\xd8'):
+                raise ValueError("Part is not a JPEG")
+            return True, data
+        except Exception as e:
+            logger.warning(f"Error reading MJPEG stream {self.url}: {e}")
+            self.release()
+            return False, None
+
+    def _read_part_headers(self) -> Dict[str, str]:
+        """Skip to the next boundary line and parse the part headers after it"""
+        while not self._boundary_consumed:
+            line = self._readline()
+            stripped = line.strip()
+            if stripped.startswith(b'--') and (self.boundary is None or stripped[2:].startswith(self.boundary)):
+                break
+        self._boundary_consumed = False
+        headers = {}
+        while True:
+            line = self._readline().strip()
+            if not line:
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    def _readline(self) -> bytes:
+        line = self.response.readline(self.max_frame_size)
+        if not line:
+            raise ConnectionError("Stream closed by camera")
+        return line
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self.response.read(size)
+        if len(data) < size:
+            raise ConnectionError("Stream closed by camera")
+        return data
+
+    def _read_until_boundary(self) -> bytes:
+        """Fallback for parts without Content-Length: collect lines up to the next boundary"""
+        data = bytearray()
+        while len(data) <= self.max_frame_size:
+            line = self._readline()
+            if line.startswith(b'--') and (self.boundary is None or line[2:].startswith(self.boundary)):
+                # The next part's headers follow directly
+                self._boundary_consumed = True
+                break
+            data += line
+        else:
+            raise ValueError(f"Part exceeds {self.max_frame_size} bytes")
+        return bytes(data).rstrip(b'\r\n')
+
+    def release(self):
+        """Close the connection"""
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.response = None
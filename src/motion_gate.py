@@ -0,0 +1,69 @@
+import logging
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class MotionGate:
+    def __init__(self, thumb_width: int = 160, min_area: float = 0.002, padding: float = 0.2,
+                 history: int = 300, var_threshold: float = 25, warmup_frames: int = 5):
+        """
+        Cheap pixel-level motion detection on a downscaled grayscale thumbnail
+        Args:
+            thumb_width: Width frames are downscaled to before background subtraction
+            min_area: Fraction of the thumbnail that must change to count as motion
+            padding: ROI growth on each side, as a fraction of its size, so faces at
+                the edge of the moving region are kept whole
+            history: Frames the background model remembers
+            var_threshold: MOG2 variance threshold; higher ignores more noise
+            warmup_frames: Frames fed to a new background model before it reports motion
+        """
+        self.thumb_width = thumb_width
+        self.min_area = min_area
+        self.padding = padding
+        self.history = history
+        self.var_threshold = var_threshold
+        self.warmup_frames = warmup_frames
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.reset()
+
+    def reset(self):
+        """Start a new background model, e.g. after the camera reconnects"""
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=self.history, varThreshold=self.var_threshold, detectShadows=False)
+        self.frames = 0
+        self.shape = None
+
+    def update(self, frame: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Feed a frame to the background model
+        Returns:
+            Bounding box (x, y, w, h) of the moving region in frame coordinates, or None
+        """
+        height, width = frame.shape[:2]
+        if frame.shape != self.shape:
+            if self.shape is not None:
+                self.reset()
+            self.shape = frame.shape
+        scale = self.thumb_width / width
+        small = cv2.resize(frame, (self.thumb_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        mask = self.subtractor.apply(gray)
+        self.frames += 1
+        if self.frames <= self.warmup_frames:
+            # Everything differs from an empty model; learn the scene before reporting motion
+            return None
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        if cv2.countNonZero(mask) < self.min_area * mask.size:
+            return None
+
+        # One region covering all motion keeps detection to a single Haar pass
+        x, y, w, h = cv2.boundingRect(mask)
+        pad_x, pad_y = int(w * self.padding), int(h * self.padding)
+        x0 = max(0, int((x - pad_x) / scale))
+        y0 = max(0, int((y - pad_y) / scale))
+        x1 = min(width, int((x + w + pad_x) / scale) + 1)
+        y1 = min(height, int((y + h + pad_y) / scale) + 1)
+        return x0, y0, x1 - x0, y1 - y0
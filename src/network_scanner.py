@@ -1,9 +1,12 @@
 import json
 import os
+import time
+import threading
 import subprocess
-import cv2
 import logging
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import requests
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +16,12 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 MAC_CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'mac_address_config.json')
+# Last known MAC -> IP mappings, so startup does not have to wait for arp-scan
+DEVICE_CACHE_FILE = os.getenv("DEVICE_CACHE_FILE", "device_cache.json")
+# Seconds to wait for a camera to answer its stream URL
+CAMERA_PROBE_TIMEOUT = float(os.getenv("CAMERA_PROBE_TIMEOUT", 3))
+# Upper bound on concurrent camera probes
+MAX_PROBE_WORKERS = 8
 
 def load_mac_config() -> Dict:
     """Load the MAC address configuration from file."""
@@ -32,13 +41,16 @@ def load_mac_config() -> Dict:
         logger.error(f"Error loading MAC config: {e}")
         raise
 
-def verify_camera_stream(url: str, retries: int = 3) -> bool:
+def verify_camera_stream(url: str, retries: int = 2, timeout: float = CAMERA_PROBE_TIMEOUT) -> bool:
     """
     Verify if a camera stream is accessible with retries.
+    Only the response headers and first bytes are read, instead of opening a full
+    OpenCV capture and decoding a frame.
     
     Args:
         url: The camera stream URL to verify
         retries: Number of times to retry on failure
+        timeout: Connect and read timeout of each attempt, in seconds
         
     Returns:
         bool: True if camera is accessible, False otherwise
@@ -47,25 +59,19 @@ def verify_camera_stream(url: str, retries: int = 3) -> bool:
     
     for attempt in range(retries):
         try:
-            cap = cv2.VideoCapture(url)
-            if not cap.isOpened():
-                logger.warning(f"Failed to open camera stream {url} (attempt {attempt + 1})")
-                continue
-                
-            ret, frame = cap.read()
-            cap.release()
-            
-            if ret and frame is not None:
-                logger.info(f"Successfully verified camera stream: {url}")
-                return True
-            else:
-                logger.warning(f"Could not read frame from {url} (attempt {attempt + 1})")
+            with requests.get(url, stream=True, timeout=(timeout, timeout)) as response:
+                if response.status_code != 200:
+                    logger.warning(f"Camera stream {url} answered HTTP {response.status_code} (attempt {attempt + 1})")
+                    continue
+                content_type = response.headers.get('Content-Type', '')
+                # MJPEG streams are multipart; otherwise the body must start like a JPEG (FF D8)
+                if content_type.startswith(('multipart/', 'image/')) or response.raw.read(2) == b'\xff\xd8':
+                    logger.info(f"Successfully verified camera stream: {url}")
+                    return True
+                logger.warning(f"Unexpected content from {url}: {content_type!r} (attempt {attempt + 1})")
                 
         except Exception as e:
-            logger.error(f"Error verifying camera stream {url} (attempt {attempt + 1}): {e}")
-            
-        if attempt < retries - 1:
-            continue
+            logger.warning(f"Error verifying camera stream {url} (attempt {attempt + 1}): {e}")
             
     logger.error(f"Failed to verify camera stream after {retries} attempts: {url}")
     return False
@@ -109,15 +115,151 @@ def run_arp_scan() -> List[Dict[str, str]]:
         logger.error(f"Unexpected error in network scan: {e}")
         return []
 
+def read_neighbor_table() -> List[Dict[str, str]]:
+    """
+    Read resolved entries of the kernel neighbor (ARP) table, without sending any packets.
+    Uses /proc/net/arp and falls back to `ip neigh` where it is not available.
+    """
+    devices = []
+    try:
+        with open('/proc/net/arp', 'r') as file:
+            next(file)  # Header
+            for line in file:
+                fields = line.split()
+                # Flags 0x0 mark incomplete entries, whose MAC is all zeros
+                if len(fields) >= 4 and int(fields[2], 16) & 0x2:
+                    devices.append({'ip': fields[0], 'mac': fields[3].lower()})
+        return devices
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Error reading /proc/net/arp: {e}")
+        return devices
+
+    try:
+        result = subprocess.run(['ip', 'neigh', 'show'], capture_output=True, text=True, check=True, timeout=5)
+    except Exception as e:
+        logger.warning(f"Error running ip neigh: {e}")
+        return devices
+    for line in result.stdout.splitlines():
+        # e.g. "192.168.1.20 dev wlan0 lladdr 84:0d:8e:1b:13:5c REACHABLE"
+        fields = line.split()
+        if 'lladdr' in fields and fields[-1] not in ('FAILED', 'INCOMPLETE'):
+            devices.append({'ip': fields[0], 'mac': fields[fields.index('lladdr') + 1].lower()})
+    return devices
+
+def index_devices_by_mac(devices: List[Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+    """Index discovered devices by lowercased MAC address."""
+    return {device['mac'].lower(): device for device in devices}
+
 def find_device_by_mac(devices: List[Dict[str, str]], mac: str) -> Optional[Dict[str, str]]:
     """Find a device in the list by its MAC address."""
-    mac = mac.lower()
-    for device in devices:
-        if device['mac'] == mac:
-            logger.debug(f"Found device with MAC {mac}: {device}")
-            return device
-    logger.debug(f"No device found with MAC {mac}")
-    return None
+    device = index_devices_by_mac(devices).get(mac.lower())
+    if device is None:
+        logger.debug(f"No device found with MAC {mac}")
+    return device
+
+def load_device_cache() -> Dict[str, Dict]:
+    """Load last known MAC -> {'ip', 'last_seen'} mappings; empty if there is no cache yet."""
+    try:
+        with open(DEVICE_CACHE_FILE, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable device cache {DEVICE_CACHE_FILE}: {e}")
+        return {}
+
+def save_device_cache(discovered_by_mac: Dict[str, Dict[str, str]], config: Dict):
+    """Remember where the configured devices were seen; devices not seen keep their last IP."""
+    cache = load_device_cache()
+    now = time.time()
+    for device in config['devices']:
+        mac = device['mac'].lower()
+        discovered = discovered_by_mac.get(mac)
+        if discovered:
+            cache[mac] = {'ip': discovered['ip'], 'last_seen': now}
+    try:
+        # Write then rename so a crash never leaves a truncated cache behind
+        temp_path = f"{DEVICE_CACHE_FILE}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(cache, file, indent=2)
+        os.replace(temp_path, DEVICE_CACHE_FILE)
+    except Exception as e:
+        logger.warning(f"Could not write device cache {DEVICE_CACHE_FILE}: {e}")
+
+def resolve_devices(config: Dict, discovered_by_mac: Dict[str, Dict[str, str]]) -> Dict:
+    """
+    Match configured devices against discovered ones, verifying cameras concurrently.
+    
+    Returns:
+        Dict containing lists of cameras, sensors, and server info
+    """
+    result = {
+        'cameras': [],
+        'sensors': [],
+        'server': None
+    }
+    candidates = []
+    
+    # Process each configured device
+    for device in config['devices']:
+        mac = device['mac'].lower()
+        discovered = discovered_by_mac.get(mac)
+        if not discovered:
+            logger.warning(f"Device not found on network: {device['name']} ({mac})")
+            continue
+            
+        ip = discovered['ip']
+        logger.info(f"Found device {device['name']} at {ip}")
+        
+        if device['role'] == 'camera':
+            candidates.append({
+                'url': f"http://{ip}:{device['port']}{device['stream_path']}",
+                'ip': ip,
+                'port': device['port'],
+                'stream_path': device['stream_path'],
+                'mac': mac,
+                'name': device['name'],
+                # Memory for buffered and queued clip frames, in MB; None uses CLIP_BUFFER_MB
+                'clip_buffer_mb': device.get('clip_buffer_mb')
+            })
+        
+        elif device['role'] == 'sensor':
+            sensor_info = {
+                'ip': ip,
+                'mac': mac,
+                'name': device['name'],
+                # MACs of the cameras covering this sensor's zone; None means all cameras
+                'cameras': [m.lower() for m in device['cameras']] if 'cameras' in device else None
+            }
+            result['sensors'].append(sensor_info)
+            logger.info(f"Added sensor: {sensor_info}")
+        
+        elif device['role'] == 'server':
+            server_info = {
+                'ip': ip,
+                'mac': mac,
+                'name': device['name']
+            }
+            result['server'] = server_info
+            logger.info(f"Added server: {server_info}")
+    
+    if candidates:
+        # Offline cameras cost one probe timeout in total rather than one each
+        with ThreadPoolExecutor(max_workers=min(len(candidates), MAX_PROBE_WORKERS)) as executor:
+            verified = list(executor.map(lambda camera: verify_camera_stream(camera['url']), candidates))
+        for camera_info, ok in zip(candidates, verified):
+            if ok:
+                result['cameras'].append(camera_info)
+                logger.info(f"Added camera: {camera_info}")
+            else:
+                logger.warning(f"Camera stream not accessible: {camera_info['url']}")
+    
+    logger.info(f"Resolved {len(result['cameras'])} cameras, "
+               f"{len(result['sensors'])} sensors, "
+               f"{'1' if result['server'] else '0'} server")
+    return result
 
 def scan_network_for_devices() -> Dict:
     """
@@ -137,78 +279,58 @@ def scan_network_for_devices() -> Dict:
             logger.warning("No devices found in network scan")
             return {'cameras': [], 'sensors': [], 'server': None}
         
-        result = {
-            'cameras': [],
-            'sensors': [],
-            'server': None
-        }
-        
-        # Process each configured device
-        for device in config['devices']:
-            mac = device['mac'].lower()
-            logger.info(f"Looking for configured device: {device['name']} ({mac})")
-            
-            discovered = find_device_by_mac(discovered_devices, mac)
-            if not discovered:
-                logger.warning(f"Device not found on network: {device['name']} ({mac})")
-                continue
-                
-            ip = discovered['ip']
-            logger.info(f"Found device {device['name']} at {ip}")
-            
-            if device['role'] == 'camera':
-                url = f"http://{ip}:{device['port']}{device['stream_path']}"
-                if verify_camera_stream(url):
-                    camera_info = {
-                        'url': url,
-                        'ip': ip,
-                        'port': device['port'],
-                        'stream_path': device['stream_path'],
-                        'mac': mac,
-                        'name': device['name']
-                    }
-                    result['cameras'].append(camera_info)
-                    logger.info(f"Added camera: {camera_info}")
-                else:
-                    logger.warning(f"Camera stream not accessible: {url}")
-            
-            elif device['role'] == 'sensor':
-                sensor_info = {
-                    'ip': ip,
-                    'mac': mac,
-                    'name': device['name']
-                }
-                result['sensors'].append(sensor_info)
-                logger.info(f"Added sensor: {sensor_info}")
-            
-            elif device['role'] == 'server':
-                server_info = {
-                    'ip': ip,
-                    'mac': mac,
-                    'name': device['name']
-                }
-                result['server'] = server_info
-                logger.info(f"Added server: {server_info}")
-        
-        logger.info(f"Scan complete. Found: {len(result['cameras'])} cameras, "
-                   f"{len(result['sensors'])} sensors, "
-                   f"{'1' if result['server'] else '0'} server")
-        return result
+        discovered_by_mac = index_devices_by_mac(discovered_devices)
+        save_device_cache(discovered_by_mac, config)
+        return resolve_devices(config, discovered_by_mac)
         
     except Exception as e:
         logger.error(f"Error during network scan: {e}", exc_info=True)
         return {'cameras': [], 'sensors': [], 'server': None}
 
-def get_network_devices() -> Dict:
+def scan_cached_devices() -> Optional[Dict]:
+    """
+    Resolve configured devices from their last known IPs, without arp-scan.
+    
+    Returns:
+        Dict containing discovered devices, or None if nothing is cached
+    """
+    cache = load_device_cache()
+    if not cache:
+        return None
+    logger.info(f"Resolving devices from cache {DEVICE_CACHE_FILE}")
+    try:
+        config = load_mac_config()
+        return resolve_devices(config, {mac: {'mac': mac, 'ip': entry['ip']} for mac, entry in cache.items()})
+    except Exception as e:
+        logger.error(f"Error resolving cached devices: {e}", exc_info=True)
+        return None
+
+def get_network_devices(on_reconcile: Optional[Callable[[Dict], None]] = None) -> Dict:
     """
     Get all network devices. Main entry point for network scanning.
+    When last known addresses are cached, they are used right away and a full scan
+    runs in the background to reconcile them.
+    
+    Args:
+        on_reconcile: Called with the background scan's result once it completes
     
     Returns:
         Dict containing discovered devices
     """
     logger.info("Starting network device discovery")
     try:
-        return scan_network_for_devices()
+        cached = scan_cached_devices()
+        if cached is None or not cached['cameras']:
+            return scan_network_for_devices()
+        
+        def reconcile():
+            result = scan_network_for_devices()
+            logger.info("Background network scan reconciled the device cache")
+            if on_reconcile is not None:
+                on_reconcile(result)
+        
+        threading.Thread(target=reconcile, name="network-reconcile", daemon=True).start()
+        return cached
     except Exception as e:
         logger.error(f"Failed to get network devices: {e}", exc_info=True)
         return {'cameras': [], 'sensors': [], 'server': None}
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+import logging
+from typing import Dict, List, Optional
+from firebase_admin import messaging
+
+logger = logging.getLogger(__name__)
+
+# Alerts for the same key within this many seconds are coalesced into one
+NOTIFY_WINDOW = float(os.getenv("NOTIFY_WINDOW", 30))
+# Global FCM budget shared by every alert source
+NOTIFY_RATE_PER_MINUTE = float(os.getenv("NOTIFY_RATE_PER_MINUTE", 12))
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", 5))
+# FCM accepts at most 500 messages per send_each call
+MAX_BATCH_SIZE = 500
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        """Token bucket refilled at `rate` tokens per second up to `capacity`"""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, count: int = 1) -> int:
+        """Take up to `count` tokens and return how many were granted"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            granted = min(count, int(self.tokens))
+            self.tokens -= granted
+            return granted
+
+class NotificationAggregator:
+    def __init__(self, window: float = NOTIFY_WINDOW, rate_per_minute: float = NOTIFY_RATE_PER_MINUTE,
+                 burst: int = NOTIFY_BURST, flush_interval: float = 1.0):
+        """
+        Debounce, batch and rate limit FCM alerts
+        Args:
+            window: Seconds during which further alerts for the same key are coalesced
+            rate_per_minute: Global sustained rate of messages sent
+            burst: Messages that may be sent back to back before the rate applies
+            flush_interval: Seconds between batched sends
+        """
+        self.window = window
+        self.flush_interval = flush_interval
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.pending: Dict[str, Dict] = {}
+        self.last_sent: Dict[str, float] = {}
+        self.suppressed: Dict[str, int] = {}
+        self.stats = {'queued': 0, 'coalesced': 0, 'sent': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self, key: str, title: str, body: str, topic: str,
+               data: Optional[Dict[str, str]] = None, app=None) -> bool:
+        """
+        Queue an alert for the next batched send
+        Args:
+            key: Debounce key, e.g. camera or track id; one alert per key and window is sent
+        Returns:
+            True if a new alert was queued, False if it was coalesced into another one
+        """
+        self._ensure_started()
+        now = time.time()
+        alert = {'title': title, 'body': body, 'topic': topic, 'data': data or {}, 'app': app}
+        with self._lock:
+            if key in self.pending:
+                # Keep the latest details but still send a single message
+                self.pending[key] = alert
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                self.stats['coalesced'] += 1
+                return False
+            if now - self.last_sent.get(key, 0) < self.window:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                self.stats['coalesced'] += 1
+                return False
+            self.pending[key] = alert
+            self.stats['queued'] += 1
+            return True
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="notification-aggregator", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing notifications: {e}")
+
+    def flush(self) -> int:
+        """Send as many pending alerts as the rate limit allows; returns the number sent"""
+        with self._lock:
+            self._prune(time.time())
+            if not self.pending:
+                return 0
+            granted = self.bucket.take(min(len(self.pending), MAX_BATCH_SIZE))
+            keys = list(self.pending)[:granted]
+            batch = []
+            now = time.time()
+            for key in keys:
+                alert = self.pending.pop(key)
+                alert['suppressed'] = self.suppressed.pop(key, 0)
+                self.last_sent[key] = now
+                batch.append(alert)
+        if not batch:
+            return 0
+
+        # send_each takes a single app, so group alerts by the app they were raised with
+        by_app: Dict[int, List[Dict]] = {}
+        for alert in batch:
+            by_app.setdefault(id(alert['app']), []).append(alert)
+
+        sent = 0
+        for alerts in by_app.values():
+            messages = [self._build_message(alert) for alert in alerts]
+            try:
+                response = messaging.send_each(messages, app=alerts[0]['app'])
+                sent += response.success_count
+                for result in response.responses:
+                    if not result.success:
+                        logger.error(f"Error sending notification: {result.exception}")
+                with self._lock:
+                    self.stats['sent'] += response.success_count
+                    self.stats['failed'] += response.failure_count
+            except Exception as e:
+                logger.error(f"Error sending notification batch: {e}")
+                with self._lock:
+                    self.stats['failed'] += len(messages)
+        logger.info(f"Sent {sent}/{len(batch)} batched notifications")
+        return sent
+
+    def _prune(self, now: float):
+        """Forget keys whose window has passed, so per-event keys do not pile up (lock held)"""
+        expired = [key for key, sent in self.last_sent.items() if now - sent >= self.window]
+        for key in expired:
+            del self.last_sent[key]
+            if key not in self.pending:
+                self.suppressed.pop(key, None)
+
+    @staticmethod
+    def _build_message(alert: Dict) -> messaging.Message:
+        body = alert['body']
+        data = dict(alert['data'])
+        if alert['suppressed']:
+            body = f"{body} (+{alert['suppressed']} more)"
+            data['coalesced'] = str(alert['suppressed'])
+        return messaging.Message(
+            notification=messaging.Notification(title=alert['title'], body=body),
+            data=data,
+            topic=alert['topic'],
+        )
+
+# Shared by all alert sources so the rate limit is global
+aggregator = NotificationAggregator()
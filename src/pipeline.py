@@ -0,0 +1,134 @@
+import threading
+import logging
+from queue import Queue, Empty, Full
+from typing import Any, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Drop policies applied when a stage's input queue is full
+DROP_OLDEST = 'drop_oldest'   # Discard the oldest queued item to make room (live data)
+DROP_NEWEST = 'drop_newest'   # Discard the incoming item
+NEVER_DROP = 'never_drop'     # Block the producer until there is room (evidence)
+
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, NEVER_DROP)
+
+class PipelineStage:
+    def __init__(self, name: str, handler: Callable[[Any], Optional[Iterable[Any]]],
+                 maxsize: int = 4, workers: int = 1, drop_policy: str = DROP_OLDEST,
+                 next_stage: Optional['PipelineStage'] = None):
+        """
+        A bounded queue drained by its own worker threads
+        Args:
+            name: Stage name used in logs and thread names
+            handler: Called with each item; returns items to forward to next_stage, or None
+            maxsize: Capacity of the input queue
+            workers: Number of worker threads
+            drop_policy: One of DROP_OLDEST, DROP_NEWEST or NEVER_DROP
+            next_stage: Stage receiving the handler's output
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy for stage {name}: {drop_policy}")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.drop_policy = drop_policy
+        self.next_stage = next_stage
+        self.queue = Queue(maxsize=maxsize)
+        self.stop_event = threading.Event()
+        self.threads: List[threading.Thread] = []
+        self.processed = 0
+        self.dropped = 0
+        self._stats_lock = threading.Lock()
+
+    def put(self, item: Any) -> bool:
+        """Queue an item according to the drop policy; returns False if it was dropped"""
+        if self.drop_policy == NEVER_DROP:
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put(item, timeout=0.5)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except Full:
+                if self.drop_policy == DROP_NEWEST:
+                    self._count_drop()
+                    return False
+                try:
+                    self.queue.get_nowait()
+                    self._count_drop()
+                except Empty:
+                    pass
+
+    def _count_drop(self):
+        with self._stats_lock:
+            self.dropped += 1
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                item = self.queue.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                outputs = self.handler(item)
+                if outputs and self.next_stage is not None:
+                    for output in outputs:
+                        self.next_stage.put(output)
+            except Exception as e:
+                logger.error(f"Error in pipeline stage {self.name}: {e}")
+            finally:
+                with self._stats_lock:
+                    self.processed += 1
+
+    def start(self):
+        """Start the worker threads"""
+        self.stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 5):
+        """Stop the worker threads; items still queued are discarded"""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads.clear()
+
+    def stats(self) -> dict:
+        """Queue depth and counters for monitoring"""
+        with self._stats_lock:
+            return {
+                'queued': self.queue.qsize(),
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'drop_policy': self.drop_policy
+            }
+
+class Pipeline:
+    def __init__(self, stages: List[PipelineStage]):
+        """Chain stages so that each stage's output feeds the next one"""
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def put(self, item: Any) -> bool:
+        """Feed an item into the first stage"""
+        return self.stages[0].put(item)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,95 @@
+import logging
+import threading
+from typing import Callable, List, Tuple
+import requests
+
+logger = logging.getLogger(__name__)
+
+def parse_sensor_values(buffer: str) -> Tuple[List[str], str]:
+    """
+    Split complete values out of a text buffer received from a sensor
+    Accepts one value per line, optionally as Server-Sent Events ("data: 1").
+    Returns:
+        (values, remainder): parsed values and the incomplete trailing line
+    """
+    *lines, remainder = buffer.split('\n')
+    values = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(':'):
+            continue  # Blank separator or SSE comment/keep-alive
+        if ':' in line:
+            field, _, line = line.partition(':')
+            if field.strip() != 'data':
+                continue  # Other SSE fields (event, id, retry)
+            line = line.strip()
+        if line:
+            values.append(line)
+    return values, remainder
+
+class SensorStreamClient:
+    def __init__(self, sensor: dict, on_value: Callable[[str], None], stop_event: threading.Event,
+                 poll_interval: float = 0.1, connect_timeout: float = 3.0, read_timeout: float = 30.0,
+                 max_backoff: float = 30.0):
+        """
+        Persistent client for a sensor's /stream endpoint
+        Chunked or SSE responses are parsed incrementally as bytes arrive; sensors that answer
+        with a single value per request are polled over one keep-alive session instead.
+        Args:
+            on_value: Called with every value as soon as it is parsed
+            poll_interval: Delay between requests in keep-alive polling mode
+            read_timeout: Seconds without data before the stream is considered dead
+            max_backoff: Upper bound for the reconnect delay
+        """
+        self.sensor = sensor
+        self.url = f"http://{sensor['ip']}:{sensor.get('port', 81)}/stream"
+        self.on_value = on_value
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+
+    def run(self):
+        """Read the sensor until stop_event is set, reconnecting with exponential backoff"""
+        backoff = 0.5
+        while not self.stop_event.is_set():
+            try:
+                with self.session.get(self.url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    backoff = 0.5
+                    if 'Content-Length' in response.headers:
+                        self._handle_single(response)
+                        self.stop_event.wait(self.poll_interval)
+                    else:
+                        self._handle_stream(response)
+                        # Stream ended cleanly; avoid hammering sensors that close after each value
+                        self.stop_event.wait(self.poll_interval)
+            except Exception as e:
+                logger.warning(f"Sensor {self.sensor['name']} ({self.sensor['mac']}) stream error: {e}; "
+                               f"reconnecting in {backoff:.1f}s")
+                self.stop_event.wait(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+        self.session.close()
+
+    def _handle_single(self, response):
+        """Keep-alive polling mode: the whole body is one value"""
+        value = response.text.strip()
+        if value:
+            self.on_value(value)
+
+    def _handle_stream(self, response):
+        """Streaming mode: emit each value as soon as its line is complete"""
+        buffer = ''
+        for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+            if self.stop_event.is_set():
+                return
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode('utf-8', errors='ignore')
+            values, buffer = parse_sensor_values(buffer + chunk.replace('\r', ''))
+            for value in values:
+                self.on_value(value)
+        # The server closed the stream; a trailing value without newline is still valid
+        values, _ = parse_sensor_values(buffer + '\n')
+        for value in values:
+            self.on_value(value)
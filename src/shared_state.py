@@ -1,45 +1,184 @@
+import os
+import time
 import threading
-from queue import Queue
+from src.frame_broadcaster import FrameBroadcaster
 
 # Shared state for the application
 camera_streams = {}
 camera_caps = {}
+camera_pipelines = {}
+clip_recorders = {}
 sensor_addresses = {}
 stop_event = threading.Event()
 
-# Frame buffers for each camera
-frame_queues = {
-    1: Queue(maxsize=10),
-    2: Queue(maxsize=10)
-}
+# Latest-frame broadcasters for each camera, created on first use, each
+# backed by a ring buffer of FRAME_RING_SLOTS preallocated frames
+FRAME_RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", 4))
+frame_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+_shared_frames = False
 
-# Sensor data buffer
+# Sensor data buffer: motion state per sensor MAC, plus whether any sensor sees motion
 sensor_data = {
-    'motion_detected': False
+    'motion_detected': False,
+    'sensors': {}
 }
+# Values posted without a MAC are recorded under this key
+DEFAULT_SENSOR = 'default'
+# Seconds a camera keeps processing after its sensors last reported motion
+MOTION_HOLD_TIME = float(os.getenv("MOTION_HOLD_TIME", 5))
+# Camera MACs covered by each sensor MAC; sensors missing here cover every camera
+sensor_zones = {}
+# Callbacks invoked with (sensor MAC, new motion state) whenever a sensor's state changes
+sensor_subscribers = []
+# Sensor updates may come from the I/O hub thread, sensor threads and Flask
+_sensor_lock = threading.Lock()
+
+# Reachability of sensors and cameras by MAC, maintained by the I/O hub
+device_health = {}
+
+# Concurrent /video_feed viewers allowed per camera (0: unlimited)
+MAX_VIEWERS_PER_CAMERA = int(os.getenv("MAX_VIEWERS_PER_CAMERA", 8))
+viewer_counts = {}
+_viewers_lock = threading.Lock()
+
+def get_broadcaster(camera_id):
+    """Get the frame broadcaster for a camera, creating it if needed"""
+    with _broadcasters_lock:
+        broadcaster = frame_broadcasters.get(camera_id)
+        if broadcaster is None:
+            shared_name = f"ssframes_{os.getpid()}_{camera_id}" if _shared_frames else None
+            broadcaster = FrameBroadcaster(camera_id, slots=FRAME_RING_SLOTS, shared_name=shared_name)
+            frame_broadcasters[camera_id] = broadcaster
+        return broadcaster
+
+def enable_shared_frames():
+    """Keep frames of cameras created from now on in shared memory, readable by other processes"""
+    global _shared_frames
+    _shared_frames = True
+
+def close_broadcasters():
+    """Release all frame buffers, including shared memory blocks"""
+    with _broadcasters_lock:
+        broadcasters = list(frame_broadcasters.values())
+        frame_broadcasters.clear()
+    for broadcaster in broadcasters:
+        broadcaster.close()
 
 def get_frame(camera_id):
-    """Get a frame from the specified camera's queue"""
-    try:
-        return frame_queues[camera_id].get_nowait()
-    except:
-        return None
+    """Get the latest frame from the specified camera without consuming it"""
+    return get_broadcaster(camera_id).latest_frame()[1]
+
+def get_jpeg(camera_id):
+    """Get the latest JPEG-encoded frame (shared by all viewers) for a camera"""
+    return get_broadcaster(camera_id).latest_jpeg()
 
 def put_frame(camera_id, frame):
-    """Put a frame into the specified camera's queue"""
-    try:
-        frame_queues[camera_id].put_nowait(frame)
-    except:
-        pass
+    """Publish a frame for the specified camera; returns its sequence number in the camera's ring"""
+    return get_broadcaster(camera_id).publish(frame)
+
+def get_jpeg_variant(camera_id, scale, quality):
+    """Get the latest frame of a camera scaled and re-encoded, shared by all viewers of that variant"""
+    return get_broadcaster(camera_id).latest_variant(scale, quality)
+
+def get_frame_seq(camera_id):
+    """Sequence number of the latest frame viewers can get from a camera (0 before the first)"""
+    return get_broadcaster(camera_id).frame_seq
 
-def update_sensor_data(value):
-    """Update sensor state from stream"""
+def get_stream_jpeg(camera_id, profile):
+    """Get the latest JPEG of a camera for a viewer's stream profile (see src/stream_profiles.py)"""
+    if profile.quality is None:
+        return get_jpeg(camera_id)
+    return get_jpeg_variant(camera_id, profile.scale, profile.quality)
+
+def wait_for_frame(camera_id, last_seq, timeout=1.0):
+    """Block the calling thread until the camera publishes a frame newer than last_seq"""
+    return get_broadcaster(camera_id).wait_newer(last_seq, timeout)
+
+async def wait_for_frame_async(camera_id, last_seq, timeout=1.0):
+    """Await, from async code, until the camera publishes a frame newer than last_seq"""
+    return await get_broadcaster(camera_id).wait_newer_async(last_seq, timeout)
+
+def put_jpeg(camera_id, data):
+    """Publish a JPEG as received from the specified camera, served to viewers without re-encoding"""
+    get_broadcaster(camera_id).publish_jpeg(data)
+
+def acquire_viewer(camera_id):
+    """Count a new viewer of a camera; returns False if the camera has reached MAX_VIEWERS_PER_CAMERA"""
+    with _viewers_lock:
+        count = viewer_counts.get(camera_id, 0)
+        if MAX_VIEWERS_PER_CAMERA and count >= MAX_VIEWERS_PER_CAMERA:
+            return False
+        viewer_counts[camera_id] = count + 1
+        return True
+
+def release_viewer(camera_id):
+    """Forget a viewer counted by acquire_viewer"""
+    with _viewers_lock:
+        viewer_counts[camera_id] = max(0, viewer_counts.get(camera_id, 0) - 1)
+
+def get_frame_stats():
+    """Ring buffer counters (sequence, written and dropped frames) per camera"""
+    with _broadcasters_lock:
+        broadcasters = dict(frame_broadcasters)
+    return {camera_id: broadcaster.stats() for camera_id, broadcaster in broadcasters.items()}
+
+def subscribe_sensor(callback):
+    """Register a callback for motion state changes"""
+    sensor_subscribers.append(callback)
+
+def set_sensor_zone(mac, camera_macs):
+    """Associate a sensor with the cameras covering its zone (None: all cameras)"""
+    with _sensor_lock:
+        if camera_macs is None:
+            sensor_zones.pop(mac, None)
+        else:
+            sensor_zones[mac] = {camera_mac.lower() for camera_mac in camera_macs}
+
+def update_sensor_data(value, mac=DEFAULT_SENSOR):
+    """Update a sensor's motion state from its stream; returns True if it changed"""
     try:
         current = bool(int(value))
-        previous = sensor_data.get('motion_detected', False)
+        now = time.time()
+        with _sensor_lock:
+            sensors = sensor_data['sensors']
+            state = sensors.setdefault(mac, {'motion': False, 'changed_at': now, 'last_motion_at': 0})
+            previous = state['motion']
+            state['motion'] = current
+            if current:
+                state['last_motion_at'] = now
+            if current != previous:
+                state['changed_at'] = now
+            sensor_data['motion_detected'] = any(s['motion'] for s in sensors.values())
         if current != previous:
-            sensor_data['motion_detected'] = current
+            for callback in list(sensor_subscribers):
+                try:
+                    callback(mac, current)
+                except Exception as e:
+                    print(f"Error in sensor subscriber: {e}")
             return True
     except ValueError:
         pass
-    return False
\ No newline at end of file
+    return False
+
+def is_motion_active(camera_mac=None, hold_time=MOTION_HOLD_TIME):
+    """
+    Whether a camera's zone has motion: any sensor covering the camera reports motion
+    now or did within hold_time seconds. Without camera_mac, any sensor counts.
+    """
+    now = time.time()
+    with _sensor_lock:
+        for mac, state in sensor_data['sensors'].items():
+            cameras = sensor_zones.get(mac)
+            if camera_mac is not None and cameras is not None and camera_mac.lower() not in cameras:
+                continue
+            if state['motion'] or now - state['last_motion_at'] <= hold_time:
+                return True
+    return False
+
+def update_device_health(mac, **fields):
+    """Record the latest health check result for a device"""
+    with _sensor_lock:
+        entry = device_health.setdefault(mac, {})
+        entry.update(fields)
+        entry['checked_at'] = time.time()
@@ -0,0 +1,82 @@
+from collections import namedtuple
+from typing import Mapping, Optional
+
+# How a viewer wants a camera's stream: frame scale, JPEG quality (None keeps the
+# camera's or broadcaster's own JPEG) and frame rate cap (None for every frame)
+StreamProfile = namedtuple('StreamProfile', ['scale', 'quality', 'max_fps'])
+
+FULL_PROFILE = StreamProfile(1.0, None, None)
+
+# Named profiles selectable with ?profile=<name>
+PROFILES = {
+    'full': FULL_PROFILE,
+    'high': StreamProfile(1.0, 80, None),
+    'medium': StreamProfile(0.75, 70, 10),
+    'low': StreamProfile(0.5, 60, 5),
+    'mobile': StreamProfile(0.25, 50, 2),
+}
+
+# Requested values are snapped to these so viewers asking for similar streams share
+# one encoded variant, and a camera never holds more than a handful of them
+SCALES = (0.25, 0.5, 0.75, 1.0)
+QUALITY_STEP = 10
+MIN_QUALITY = 30
+MAX_QUALITY = 90
+
+# Still image sizes selectable with /snapshot/<camera_id>?size=<name>
+SNAPSHOT_SIZES = {
+    'thumb': StreamProfile(0.25, 70, None),
+    'small': StreamProfile(0.5, 75, None),
+    'medium': StreamProfile(0.75, 80, None),
+    'full': FULL_PROFILE,
+}
+
+def _snap_scale(value: float) -> float:
+    return min(SCALES, key=lambda scale: abs(scale - value))
+
+def _snap_quality(value: int) -> int:
+    value = max(MIN_QUALITY, min(MAX_QUALITY, value))
+    return int(round(value / QUALITY_STEP) * QUALITY_STEP)
+
+def parse_profile(params: Mapping[str, str]) -> StreamProfile:
+    """
+    Build a stream profile from query parameters
+    ?profile=<name> picks a named profile; scale, quality and fps override its fields.
+    Raises:
+        ValueError: On an unknown profile name or a malformed number
+    """
+    name = params.get('profile')
+    if name is not None and name not in PROFILES:
+        raise ValueError(f"Unknown profile {name!r}; expected one of {', '.join(PROFILES)}")
+    profile = PROFILES[name] if name is not None else FULL_PROFILE
+
+    scale, quality, max_fps = profile
+    if params.get('scale'):
+        scale = _snap_scale(float(params['scale']))
+    if params.get('quality'):
+        quality = _snap_quality(int(params['quality']))
+    if params.get('fps'):
+        max_fps = float(params['fps'])
+        if max_fps <= 0:
+            raise ValueError("fps must be positive")
+    # Only a changed scale or quality needs re-encoding; keep the original JPEG otherwise
+    if scale != 1.0 and quality is None:
+        quality = PROFILES['high'].quality
+    return StreamProfile(scale, quality, max_fps)
+
+def parse_snapshot_profile(params: Mapping[str, str]) -> StreamProfile:
+    """
+    Build the profile of a snapshot from ?size=<name>, or from the stream parameters
+    Raises:
+        ValueError: On an unknown size or malformed parameters
+    """
+    size = params.get('size')
+    if size is None:
+        return parse_profile(params)
+    if size not in SNAPSHOT_SIZES:
+        raise ValueError(f"Unknown size {size!r}; expected one of {', '.join(SNAPSHOT_SIZES)}")
+    return SNAPSHOT_SIZES[size]
+
+def frame_interval(profile: StreamProfile) -> Optional[float]:
+    """Minimum seconds between frames sent to a viewer with this profile"""
+    return 1.0 / profile.max_fps if profile.max_fps else None
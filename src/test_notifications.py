@@ -2,6 +2,7 @@ import os
 import cv2
 import numpy as np
 from face_service import FaceService
+from src.notification_aggregator import aggregator
 from firebase_admin import initialize_app, get_app, delete_app
 from firebase_admin import credentials
 import logging
@@ -52,6 +53,9 @@ def test_notification_system():
             else:
                 logger.warning("Face was not detected as unknown")
         
+        # Notifications are batched; send them before the test app goes away
+        aggregator.flush()
+
         # Cleanup
         delete_app(app)
         os.unlink(tmp.name)
@@ -0,0 +1,210 @@
+import os
+import glob
+import json
+import time
+import uuid
+import threading
+import logging
+from queue import Queue, Empty, Full
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class UploadService:
+    def __init__(self, handler: Callable[[Dict], bool], spool_dir: Optional[str] = "spool", queue_size: int = 32,
+                 concurrency: int = 2, base_backoff: float = 2.0, max_backoff: float = 300.0,
+                 max_attempts: int = 0):
+        """
+        Background uploader with a bounded in-memory queue backed by an on-disk spool
+        Args:
+            handler: Performs one upload job (a dict); returns True on success
+            spool_dir: Directory where overflowing and failed jobs are persisted, or None to
+                keep everything in memory (such jobs are then discarded instead of retried).
+                Bytes under 'data' in the job's 'images' entries are written next to the
+                job as JPEG files and replaced by their 'path'.
+            queue_size: Capacity of the in-memory queue; overflow goes to the spool
+            concurrency: Number of uploads running at the same time
+            base_backoff: Delay in seconds before the first retry, doubled on each attempt
+            max_backoff: Upper bound for the retry delay
+            max_attempts: Attempts before a job is discarded (0 retries forever)
+        """
+        self.handler = handler
+        self.spool_dir = spool_dir
+        self.concurrency = concurrency
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.queue = Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.threads = []
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.stats = {'uploaded': 0, 'failed': 0, 'spooled': 0, 'discarded': 0}
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+
+    def submit(self, job: Dict) -> bool:
+        """Queue a job for upload, spooling it to disk if the queue is full"""
+        job = dict(job)
+        job.setdefault('id', f"{time.time_ns()}-{uuid.uuid4().hex[:8]}")
+        job.setdefault('attempts', 0)
+        job.setdefault('next_attempt', 0)
+        with self._lock:
+            self._in_flight.add(job['id'])
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except Full:
+            with self._lock:
+                self._in_flight.discard(job['id'])
+            return self._spool(job)
+
+    def _spool_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _spool(self, job: Dict) -> bool:
+        """Persist a job, and any in-memory image bytes it carries, to the spool directory"""
+        if not self.spool_dir:
+            logger.error(f"Discarding upload job {job.get('id')}: no spool directory configured")
+            with self._lock:
+                self.stats['discarded'] += 1
+            return False
+        try:
+            job = dict(job)
+            images = []
+            for index, image in enumerate(job.get('images', [])):
+                image = dict(image)
+                data = image.pop('data', None)
+                if data is not None:
+                    image['path'] = os.path.join(self.spool_dir, f"{job['id']}_{index}.jpg")
+                    with open(image['path'], 'wb') as f:
+                        f.write(data)
+                images.append(image)
+            if images:
+                job['images'] = images
+
+            path = self._spool_path(job['id'])
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(job, f)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.stats['spooled'] += 1
+            return True
+        except Exception as e:
+            logger.error(f"Failed to spool upload job {job.get('id')}: {e}")
+            return False
+
+    def _unspool(self, job_id: str):
+        if not self.spool_dir:
+            return
+        for path in [self._spool_path(job_id)] + glob.glob(os.path.join(self.spool_dir, f"{job_id}_*.jpg")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _worker(self):
+        while not self.stop_event.is_set():
+            try:
+                job = self.queue.get(timeout=0.5)
+            except Empty:
+                continue
+
+            try:
+                success = self.handler(job)
+            except Exception as e:
+                logger.error(f"Upload job {job['id']} raised: {e}")
+                success = False
+
+            if success:
+                self._unspool(job['id'])
+                with self._lock:
+                    self.stats['uploaded'] += 1
+            else:
+                self._retry_later(job)
+
+            with self._lock:
+                self._in_flight.discard(job['id'])
+
+    def _retry_later(self, job: Dict):
+        """Record a failed attempt and persist the job with its next retry time"""
+        job['attempts'] += 1
+        with self._lock:
+            self.stats['failed'] += 1
+        if self.max_attempts and job['attempts'] >= self.max_attempts:
+            logger.error(f"Discarding upload job {job['id']} after {job['attempts']} attempts")
+            self._unspool(job['id'])
+            with self._lock:
+                self.stats['discarded'] += 1
+            return
+
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (job['attempts'] - 1)))
+        job['next_attempt'] = time.time() + delay
+        logger.warning(f"Upload job {job['id']} failed (attempt {job['attempts']}), retrying in {delay:.0f}s")
+        self._spool(job)
+
+    def _replay_spool(self):
+        """Feed due spooled jobs back into the queue while it has room"""
+        if not self.spool_dir:
+            return
+        while not self.stop_event.is_set():
+            try:
+                now = time.time()
+                for name in sorted(os.listdir(self.spool_dir)):
+                    if not name.endswith('.json') or self.queue.full():
+                        continue
+                    job_id = name[:-len('.json')]
+                    with self._lock:
+                        if job_id in self._in_flight:
+                            continue
+                    try:
+                        with open(os.path.join(self.spool_dir, name)) as f:
+                            job = json.load(f)
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Unreadable spooled upload job {name}: {e}")
+                        continue
+                    if job.get('next_attempt', 0) > now:
+                        continue
+
+                    with self._lock:
+                        self._in_flight.add(job_id)
+                    try:
+                        self.queue.put_nowait(job)
+                    except Full:
+                        with self._lock:
+                            self._in_flight.discard(job_id)
+            except Exception as e:
+                logger.error(f"Error replaying upload spool: {e}")
+            self.stop_event.wait(1)
+
+    def start(self):
+        """Start upload workers and the spool replayer (which also resumes jobs from a previous run)"""
+        self.stop_event.clear()
+        targets = [self._worker] * self.concurrency + [self._replay_spool]
+        for i, target in enumerate(targets):
+            thread = threading.Thread(target=target, name=f"upload-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Upload service started with {self.concurrency} workers, spool at {self.spool_dir or 'disabled'}")
+
+    def stop(self, timeout: float = 10):
+        """Stop the workers and persist any jobs still queued in memory"""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads.clear()
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except Empty:
+                break
+            self._spool(job)
+        logger.info("Upload service stopped")
+
+    def pending(self) -> int:
+        """Number of jobs queued in memory or waiting in the spool"""
+        if not self.spool_dir:
+            return self.queue.qsize()
+        spooled = sum(1 for name in os.listdir(self.spool_dir) if name.endswith('.json'))
+        return self.queue.qsize() + spooled